@@ -0,0 +1,92 @@
+"""
+Provides uniform ownership of pointers allocated by the Rust libraries,
+along with live counts of every handle that has not been freed yet.
+"""
+from collections import Counter
+from threading import Lock
+from weakref import finalize
+
+_LIVE_HANDLES = Counter()
+_LIVE_HANDLES_LOCK = Lock()
+
+def _track(kind: str, delta: int):
+    with _LIVE_HANDLES_LOCK:
+        _LIVE_HANDLES[kind] += delta
+
+def _free(free_fn, ptr, kind: str):
+    free_fn(ptr)
+    _track(kind, -1)
+
+def live_handles() -> dict:
+    """
+    Returns the number of live native handles of each kind. A kind
+    is omitted once all of its handles have been freed.
+    """
+    with _LIVE_HANDLES_LOCK:
+        return { kind : n for kind, n in _LIVE_HANDLES.items() if n != 0 }
+
+class NativeHandle:
+    """
+    Owns a single pointer allocated by a Rust library. The pointer is
+    freed exactly once: when `release` is called, when the handle is
+    garbage collected, or at interpreter exit, whichever comes first.
+    """
+
+    def __init__(self, ptr, free_fn, kind: str):
+        """
+        Takes ownership of `ptr`, which will be passed to `free_fn` when
+        the handle is released. `kind` labels the handle in `live_handles`.
+        """
+        self.ptr = ptr
+        self.kind = kind
+        _track(kind, 1)
+        self._finalizer = finalize(self, _free, free_fn, ptr, kind)
+
+    @property
+    def alive(self) -> bool:
+        """
+        Whether the handle still owns its pointer.
+        """
+        return self._finalizer.alive
+
+    def release(self):
+        """
+        Frees the pointer if it is still owned. Safe to call repeatedly.
+        """
+        self._finalizer()
+
+    def detach(self):
+        """
+        Gives up ownership of the pointer without freeing it, returning
+        the pointer. Used when a Rust function consumes the pointer.
+        """
+        if self._finalizer.detach() is not None:
+            _track(self.kind, -1)
+        return self.ptr
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.release()
+
+class NativeOwner:
+    """
+    Mixin for Python objects that own a `NativeHandle` stored in
+    `self.handle`, allowing them to be used as context managers.
+    """
+
+    handle = None
+
+    def release(self):
+        """
+        Frees the native memory owned by this object.
+        """
+        if self.handle is not None:
+            self.handle.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.release()
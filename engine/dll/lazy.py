@@ -0,0 +1,47 @@
+"""
+Provides lazy loading of the Rust shared libraries, so that importing the
+engine (e.g. to only preprocess or validate a system) never opens them.
+"""
+from ctypes import CDLL
+from threading import Lock
+
+class LazyLibrary:
+    """
+    A stand-in for a `ctypes.CDLL` that opens the shared library at `path`,
+    and runs `configure` on it to declare its function signatures, the
+    first time one of its functions is accessed.
+    """
+
+    def __init__(self, path: str, configure):
+        self._path      = path
+        self._configure = configure
+        self._dll       = None
+        self._lock      = Lock()
+
+    @property
+    def loaded(self) -> bool:
+        """
+        Whether the shared library has been opened.
+        """
+        return self._dll is not None
+
+    def load(self):
+        """
+        Opens and configures the shared library if it is not already open,
+        returning the underlying `CDLL`.
+        """
+        with self._lock:
+            if self._dll is None:
+                dll = CDLL(self._path)
+                self._configure(dll)
+                self._dll = dll
+
+        return self._dll
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        fn = getattr(self._dll or self.load(), name)
+        setattr(self, name, fn) # Later lookups skip __getattr__
+        return fn
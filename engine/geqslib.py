@@ -4,8 +4,10 @@ properly constraining a system of equations
 and solving them with the newton-raphson method.
 """
 
-from ctypes import c_char_p, c_double, c_int, c_uint, c_void_p
+from contextlib import contextmanager
+from ctypes import c_char_p, c_double, c_int, c_uint, c_void_p, string_at
 from engine.dll.geqslib_ffi import GEQSLIB_DLL
+from engine.dll.handles import NativeHandle, NativeOwner
 import engine.dll.geqslib_ffi
 
 RUST_ERROR_OCCURRED = engine.dll.geqslib_ffi.RUST_ERROR_OCCURRED
@@ -16,11 +18,21 @@ WILL_OVERCONSTRAIN  = engine.dll.geqslib_ffi.WILL_OVERCONSTRAIN
 
 FULLY_CONSTRAINED   = engine.dll.geqslib_ffi.FULLY_CONSTRAINED
 
-class Context:
+def _c_str(text: any):
+    """
+    Encodes `text` for the FFI, passing it through if it is already `bytes`.
+    """
+    return text if type(text) == bytes else bytes(text, "utf-8")
+
+class Context(NativeOwner):
     """
     A Rust `HashMap` containing symbols in an equation or
     expression and their meaning. in Python, only constant 
     values can be added to the context  
+
+    The map is freed when `release` is called, when the `Context` 
+    is used as a context manager and its block exits, or when it is 
+    garbage collected.
     """
 
     def __init__(self, with_default_values: bool = True):
@@ -35,18 +47,113 @@ class Context:
         else:
             self.ptr = c_void_p(GEQSLIB_DLL.new_context_hash_map()) 
 
+        self.handle = NativeHandle(self.ptr, GEQSLIB_DLL.free_context_hash_map, "Context")
+        self.with_default_values = with_default_values
+        self.values = {}
+        self.sync_token = None
+
     def __setitem__(self, symbol: str, val: float):
         """
         Adds a new constant value to the context.
         """
-        c_symbol = bytes(symbol, "utf-8")
+        c_symbol = _c_str(symbol)
         GEQSLIB_DLL.add_const_to_ctx(self.ptr, c_symbol, c_double(val))
-        
-    def release(self):
+        self.values[symbol] = val
+
+    def update(self, ctx_dict: any):
+        """
+        Adds every value in `ctx_dict` to the context, skipping symbols 
+        that already hold the same value.
+        """
+        for key in ctx_dict:
+            val = ctx_dict[key]
+            if self.values.get(key) != val:
+                self[key] = val
+
+class ContextPool:
+    """
+    A pool of reusable `Context` objects. 
+
+    Contexts in Rust cannot have values removed, so a pooled context is 
+    only reused for a `ctx_dict` that defines every symbol it already 
+    holds. Only new or changed values are sent across the FFI boundary.
+
+    If `ctx_dict` provides `change_token` and `changes_since` methods, 
+    as the views in `engine.nexsys2symtab` do, a context that was last 
+    synced with it is brought up to date without scanning every value.
+    """
+
+    def __init__(self, max_size: int = 8):
+        self.max_size = max_size
+        self.free = []
+
+    def acquire(self, ctx_dict: any, include_default_values: bool = True):
+        """
+        Returns a `Context` holding exactly the values in `ctx_dict`, 
+        reusing a pooled context where possible.
+        """
+        tracks_changes = hasattr(ctx_dict, "changes_since")
+
+        for i, ctx in enumerate(self.free):
+            if ctx.with_default_values != include_default_values:
+                continue
+
+            changes = None
+            if tracks_changes and ctx.sync_token is not None:
+                changes = ctx_dict.changes_since(ctx.sync_token)
+
+            if changes is not None:
+                ctx.update(changes)
+            elif ctx.values.keys() <= ctx_dict.keys():
+                ctx.update(ctx_dict)
+            else:
+                continue
+
+            self.free.pop(i)
+            break
+
+        else:
+            ctx = create_context_with(ctx_dict, include_default_values)
+
+        if tracks_changes:
+            ctx.sync_token = ctx_dict.change_token()
+
+        return ctx
+
+    @contextmanager
+    def borrow(self, ctx_dict: any, include_default_values: bool = True):
         """
-        Frees the `Context` object. 
+        Acquires a `Context` for the duration of a `with` block, 
+        returning it to the pool afterwards.
         """
-        GEQSLIB_DLL.free_context_hash_map(self.ptr)
+        ctx = self.acquire(ctx_dict, include_default_values)
+        try:
+            yield ctx
+        finally:
+            self.give_back(ctx)
+
+    def give_back(self, ctx: Context):
+        """
+        Returns `ctx` to the pool, freeing it instead if the pool is full.
+        """
+        if len(self.free) < self.max_size and ctx.handle.alive:
+            self.free.append(ctx)
+        else:
+            ctx.release()
+
+    def clear(self):
+        """
+        Frees every pooled context.
+        """
+        for ctx in self.free:
+            ctx.release()
+        self.free.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.clear()
 
 def solve_equation(
     equation: str, 
@@ -61,12 +168,13 @@ def solve_equation(
     """
     Solves a 1-unknown equation given as a string.
     """
-    c_equation = c_char_p(bytes(equation, "utf-8"))
+    c_equation = c_char_p(_c_str(equation))
 
+    owned_ctx = None
     if not ctx:
-        ctx = Context()
+        ctx = owned_ctx = Context()
 
-    maybe_soln = c_char_p(GEQSLIB_DLL.solve_equation(
+    maybe_soln = GEQSLIB_DLL.solve_equation(
         c_equation,
         ctx.ptr,
         c_double(guess),
@@ -74,7 +182,10 @@ def solve_equation(
         c_double(soln_max),
         c_double(margin),
         c_uint(limit)
-    ))
+    )
+
+    if owned_ctx:
+        owned_ctx.release()
 
     if not maybe_soln:
         return None
@@ -86,16 +197,19 @@ class Solution:
     A solution to a system of equations.
     """
 
-    def __init__(self, c_string: c_char_p):
+    def __init__(self, c_string: int):
         """
-        Creates a new solution to a system of equations.
+        Creates a new solution to a system of equations, taking 
+        ownership of the solution string allocated by Rust. The 
+        string is copied and freed immediately.
         
         This will almost certainly misbehave if called by
         anything other than the `System.solve_system` method.
         """
-        self.ptr = c_string
+        with NativeHandle(c_string, GEQSLIB_DLL.free_solution_string, "Solution"):
+            self.text = string_at(c_string).decode("utf-8")
 
-        keys_vals = [x.split("=") for x in str(self).split("\n")]
+        keys_vals = [x.split("=") for x in self.text.split("\n")]
         
         self.soln_dict = { x[0] : float(x[1]) for x in keys_vals }
 
@@ -116,17 +230,7 @@ class Solution:
         """
         Returns the utf-8 string read in from Rust. 
         """
-        return self.ptr.value.decode("utf-8")
-
-    def __del__(self):
-        """
-        Cleans up the memory allocated to the solution string
-        by Rust.
-
-        ### TODO: 
-        This is currently a memory leak. Rust destructor fn is causing invalid pointer error.
-        """
-        # GEQSLIB_DLL.free_solution_string(self.ptr)
+        return self.text
 
 def create_context_with(ctx_dict: any, include_default_values: bool = True):
     """
@@ -140,7 +244,7 @@ def create_context_with(ctx_dict: any, include_default_values: bool = True):
 
     return ctx
 
-class System:
+class System(NativeOwner):
     """
     A constrained system of equations that can have
     its variables' guess values or domains changed
@@ -156,7 +260,7 @@ class System:
         method.
         """
         self.ptr = pointer
-        self.freed = False
+        self.handle = NativeHandle(pointer, GEQSLIB_DLL.free_system, "System")
         self.eqns = []
     
     def specify_variable(self, 
@@ -173,7 +277,7 @@ class System:
         """
         status = c_int(GEQSLIB_DLL.specify_variable(
             self.ptr,
-            c_char_p(bytes(var, "utf-8")),
+            c_char_p(_c_str(var)),
             c_double(guess),
             c_double(min),
             c_double(max),
@@ -187,26 +291,19 @@ class System:
         Tries to solve the system, returning a `Solution`
         on success or `None` on failure.
         """
-        maybe_soln = c_char_p(GEQSLIB_DLL.solve_system(
-            self.ptr, 
+        # The system is consumed by Rust during the solution attempt
+        maybe_soln = GEQSLIB_DLL.solve_system(
+            self.handle.detach(), 
             c_double(margin), 
             c_uint(limit)
-        ))
+        )
 
-        self.freed = True
         if not maybe_soln:
             return None
         
         return Solution(maybe_soln)
 
-    def __del__(self):
-        """
-        Frees the system if it was not used for a solution attempt.
-        """
-        if not self.freed:
-            GEQSLIB_DLL.free_system(self.ptr)
-
-class SystemBuilder:
+class SystemBuilder(NativeOwner):
     """
     An object for building a valid `System` instance,
     which represents a constrained system of equations.
@@ -217,18 +314,17 @@ class SystemBuilder:
         Creates a new SystemBuilder object for building a 
         constrained system of equations 
         """
-        self.freed = True # no memory malloc'ed yet
-
         if not ctx:
             ctx = Context()
 
         maybe_builder = c_void_p(GEQSLIB_DLL.new_system_builder(
-            c_char_p(bytes(equation, "utf-8")), ctx.ptr
+            c_char_p(_c_str(equation)), ctx.ptr
         ))
         if not maybe_builder:
             raise Exception(f"Failed to build system from equation: {equation}")
 
-        self.freed = False
+        self.handle = NativeHandle(maybe_builder, GEQSLIB_DLL.free_system_builder, "SystemBuilder")
+        self.ctx = ctx # keep the context alive for as long as Rust may read it
         self.eqns = [equation]
         self.ptr = maybe_builder
 
@@ -239,7 +335,7 @@ class SystemBuilder:
         to the system if it does.
         """
         status = c_int(GEQSLIB_DLL.try_constrain_with(
-            self.ptr, c_char_p(bytes(equation, "utf-8"))
+            self.ptr, c_char_p(_c_str(equation))
         ))
 
         if status.value == WILL_NOT_CONSTRAIN:
@@ -279,21 +375,14 @@ class SystemBuilder:
         if not self.is_fully_constrained():
             return None
 
-        maybe_system = c_void_p(GEQSLIB_DLL.build_system(self.ptr))
-        self.freed = True 
+        # The builder is consumed by Rust when building the system
+        maybe_system = c_void_p(GEQSLIB_DLL.build_system(self.handle.detach()))
 
         if maybe_system:
             sys = System(maybe_system)
             sys.eqns = self.eqns
+            sys.ctx = self.ctx
             return sys
 
         else:
-            return None
-
-    def __del__(self):
-        """
-        Frees the `SystemBuilder` object if it was not used to
-        make a constrained system of equations.
-        """
-        if not self.freed:
-            GEQSLIB_DLL.free_system_builder(self.ptr)
\ No newline at end of file
+            return None
\ No newline at end of file
@@ -1,10 +1,15 @@
 """
 Provides a `Matrix` type that supports a 
-number of basic matrix-math operations. 
+number of basic matrix-math operations, and
+a `MatrixBatch` type for applying them to 
+many small matrices at once. `MatrixBatch`
+is vectorized with NumPy when it is installed.
 """
 
+from array import array
 from ctypes import c_double, c_uint, c_void_p 
-from dll.gmatlib_ffi import GMATLIB_DLL
+from engine.dll.gmatlib_ffi import GMATLIB_DLL
+from engine.dll.handles import NativeHandle, NativeOwner
 
 class MatrixCreationError(Exception):
     def __str__(self) -> str:
@@ -28,16 +33,30 @@ class MatrixScalePanic(Exception):
     def __str__(self) -> str:
         return "the rust-side matrix scale method panicked"
 
-class Matrix:
+class MatrixShapeError(Exception):
+    def __init__(self, shape_left, shape_right) -> None:
+        super().__init__()
+
+        self.shape_left  = shape_left
+        self.shape_right = shape_right
+
+    def __str__(self) -> str:
+        return f"cannot combine {self.shape_left[0]}x{self.shape_left[1]} matrices with {self.shape_right[0]}x{self.shape_right[1]} matrices"
+
+class Matrix(NativeOwner):
     """
     A compact Rust-based MxN matrix.
+
+    Every `Matrix` owns its Rust allocation, which is freed when 
+    `release` is called, when the `Matrix` is used as a context 
+    manager and its block exits, or when it is garbage collected.
     """
 
     def __new__(cls, *_):
         """
         Allows loading the Rust DLL lazily.         
         """
-        if not hasattr(cls, "dll"):
+        if not hasattr(cls, "DLL"):
             cls.DLL = GMATLIB_DLL
 
         return super(Matrix, cls).__new__(cls)
@@ -45,10 +64,9 @@ class Matrix:
 
     def __init__(self, *args):
         """
-        Constructor method for `Matrix`.         
+        Constructor method for `Matrix`. When built from a pre-existing 
+        pointer, the new `Matrix` takes ownership of that pointer.
         """
-        self.malloced = False
-
         argc = len(args)
         types = [type(i) for i in args]
 
@@ -63,7 +81,6 @@ class Matrix:
                     raise MatrixCreationError
             
             self.ptr = c_void_p(Matrix.DLL.new_double_matrix(c_uint(self.rows), c_uint(self.cols))) 
-            self.malloced = True
 
             for i in range(self.rows):
                 for j in range(self.cols):
@@ -73,7 +90,6 @@ class Matrix:
         elif argc == 2 and types == [int, int]:
             self.rows, self.cols = args
             self.ptr = c_void_p(Matrix.DLL.new_double_matrix(c_uint(self.rows), c_uint(self.cols))) 
-            self.malloced = True
 
         # Build from pre-existing pointer
         elif argc == 3 and types == [int, int, c_void_p]:
@@ -81,6 +97,8 @@ class Matrix:
 
         else:
             raise MatrixCreationError
+
+        self.handle = NativeHandle(self.ptr, Matrix.DLL.free_double_matrix, "Matrix")
             
 
     def __getitem__(self, indices: tuple) -> float:
@@ -106,13 +124,11 @@ class Matrix:
                 raise IndexError
             
             else:
-                subset = Matrix(
+                return Matrix(
                     i2 - i1 + 1,
                     j2 - j1 + 1,
                     c_void_p(Matrix.DLL.subset(self.ptr, c_uint(i1), c_uint(j1), c_uint(i2), c_uint(j2)))
                 )
-                subset.malloced = True
-                return subset
             
         else:
             raise IndexError
@@ -138,18 +154,13 @@ class Matrix:
         # Matrix product
         if type(other) == Matrix:
             res  = c_void_p(Matrix.DLL.multiply_matrix(self.ptr, other.ptr))
-            rows = self.rows
-            cols = other.cols
+            return Matrix(self.rows, other.cols, res)
 
         # Scale matrix
         elif type(other) in [int, float]:
-            new  = self.clone()
+            new = self.clone()
             new.scale(other)
-            rows = self.rows
-            cols = self.cols
-            res  = new.ptr 
-
-        return Matrix(rows, cols, res)
+            return new
 
 
     def __or__(self, other):
@@ -166,13 +177,11 @@ class Matrix:
         rows = self.rows
         cols = self.cols + other.cols
 
-        augment = Matrix(
+        return Matrix(
             rows, 
             cols, 
             c_void_p(Matrix.DLL.augment_with(self.ptr, other.ptr))
         )
-        augment.malloced = True
-        return augment
 
 
     def __pow__(self, other):
@@ -216,15 +225,6 @@ class Matrix:
         return output          
 
 
-    def __del__(self):
-        """
-        Destructor method for `Matrix` 
-        """
-        # Prevent double free if refrencing another `Matrix`'s ptr:
-        if self.malloced:
-            Matrix.DLL.free_double_matrix(self.ptr)
-
-
     def scale(self, scalar):
         """
         Scales the matrix in-place, multiplying all
@@ -240,7 +240,7 @@ class Matrix:
         """
         success = c_void_p(Matrix.DLL.transpose(self.ptr))
         
-        if success != 0:
+        if success.value:
             return Matrix(self.cols, self.rows, success)
 
         return None
@@ -258,10 +258,339 @@ class Matrix:
         """
         Creates a copy of the `Matrix` object.
         """
-        cln = Matrix(
+        return Matrix(
             self.rows,
             self.cols,
             c_void_p(Matrix.DLL.clone_double_matrix(self.ptr))
         )
-        cln.malloced = True
-        return cln
+
+
+_NUMPY = False
+
+def _numpy():
+    """
+    Returns the `numpy` module, or `None` if it is not installed. 
+    The import is deferred until a batch operation first needs it.
+    """
+    global _NUMPY
+    if _NUMPY is False:
+        try:
+            import numpy
+            _NUMPY = numpy
+        except ImportError:
+            _NUMPY = None
+
+    return _NUMPY
+
+class MatrixBatch:
+    """
+    A batch of N same-shaped MxN matrices stored row-major in one 
+    contiguous `array('d')` buffer. 
+
+    Every operation applies to the whole batch in a single call. If NumPy 
+    is installed, each call runs as vectorized NumPy operations over a view 
+    of the buffer; otherwise the batch is processed with Python loops. 
+    The Rust library is not used.
+    """
+
+    def __init__(self, *args):
+        """
+        Constructor method for `MatrixBatch`.
+        """
+        argc = len(args)
+        types = [type(i) for i in args]
+
+        # Build batch from list[list[list[float]]]
+        if argc == 1 and types == [list]:
+            mats = args[0]
+            if not mats:
+                raise MatrixCreationError
+
+            self.count = len(mats)
+            self.rows  = len(mats[0])
+            self.cols  = len(mats[0][0])
+
+            for mat in mats:
+                if len(mat) != self.rows or any(len(row) != self.cols for row in mat):
+                    raise MatrixCreationError
+
+            self.data = array("d", (v for mat in mats for row in mat for v in row))
+
+        # Build N zero matrices with m rows and n cols 
+        elif argc == 3 and types == [int, int, int]:
+            self.count, self.rows, self.cols = args
+            if self.count < 0 or self.rows < 0 or self.cols < 0:
+                raise MatrixCreationError
+
+            self.data = array("d", bytes(8 * self.count * self.rows * self.cols))
+
+        # Build from a pre-existing buffer
+        elif argc == 4 and types[:3] == [int, int, int] and types[3] == array:
+            self.count, self.rows, self.cols, self.data = args
+            if len(self.data) != self.count * self.rows * self.cols:
+                raise MatrixCreationError
+
+        else:
+            raise MatrixCreationError
+
+
+    @classmethod
+    def from_matrices(cls, matrices: list):
+        """
+        Copies a list of same-shaped `Matrix` objects into a new batch.
+        """
+        return cls([[[m[i, j] for j in range(m.cols)] for i in range(m.rows)] for m in matrices])
+
+
+    @classmethod
+    def _from_ndarray(cls, vals):
+        """
+        Copies a `(count, rows, cols)` NumPy array into a new batch.
+        """
+        count, rows, cols = vals.shape
+        data = array("d")
+        data.frombytes(_NUMPY.ascontiguousarray(vals, dtype = _NUMPY.float64).tobytes())
+        return cls(count, rows, cols, data)
+
+
+    def _ndarray(self):
+        """
+        Returns a `(count, rows, cols)` NumPy view of the buffer.
+        """
+        return _NUMPY.frombuffer(self.data, dtype = _NUMPY.float64).reshape(self.count, self.rows, self.cols)
+
+
+    def __len__(self) -> int:
+        return self.count
+
+
+    def __getitem__(self, n: int) -> list:
+        """
+        Returns a copy of the `n`th matrix as a `list[list[float]]`.
+        """
+        if not 0 <= n < self.count:
+            raise MatrixIndexOutOfBoundsError
+
+        size = self.rows * self.cols
+        vals = self.data[n * size:(n + 1) * size]
+        return [vals[i * self.cols:(i + 1) * self.cols].tolist() for i in range(self.rows)]
+
+
+    def to_matrix(self, n: int) -> Matrix:
+        """
+        Copies the `n`th matrix into a new `Matrix`.
+        """
+        return Matrix(self[n])
+
+
+    def __mul__(self, other):
+        """
+        Batched matrix product operator. A batch of one matrix, or a 
+        `Matrix`, is broadcast against every matrix in the other operand.
+        """
+        np = _numpy()
+
+        if type(other) in [int, float]:
+            if np:
+                return MatrixBatch._from_ndarray(self._ndarray() * other)
+            return MatrixBatch(self.count, self.rows, self.cols, array("d", (v * other for v in self.data)))
+
+        if isinstance(other, Matrix):
+            other = MatrixBatch.from_matrices([other])
+
+        if not isinstance(other, MatrixBatch):
+            return NotImplemented
+
+        if self.cols != other.rows or (1 not in (self.count, other.count) and self.count != other.count):
+            raise MatrixShapeError((self.rows, self.cols), (other.rows, other.cols))
+
+        if np:
+            return MatrixBatch._from_ndarray(np.matmul(self._ndarray(), other._ndarray()))
+
+        count = max(self.count, other.count)
+        m, p, n = self.rows, self.cols, other.cols
+        a_size = m * p if self.count > 1 else 0
+        b_size = p * n if other.count > 1 else 0
+        a, b = self.data, other.data
+
+        out = array("d", bytes(8 * count * m * n))
+        o = 0
+        for k in range(count):
+            a0, b0 = k * a_size, k * b_size
+            for i in range(m):
+                ai = a0 + i * p
+                for j in range(n):
+                    acc = 0.0
+                    bj = b0 + j
+                    for q in range(p):
+                        acc += a[ai + q] * b[bj + q * n]
+                    out[o] = acc
+                    o += 1
+
+        return MatrixBatch(count, m, n, out)
+
+
+    def __pow__(self, other):
+        """
+        Provides shorthand representations for batched transpose or 
+        inverse operations if the right-hand operand is 'T' or '-1', 
+        respectively. Use `invert` to get per-item success flags.
+        """
+        if other == "T":
+            return self.transpose()
+
+        if other == "-1":
+            inv = self.clone()
+            inv.invert()
+            return inv
+
+
+    def transpose(self):
+        """
+        Transposes every matrix in the batch, returning a new batch.
+        """
+        if _numpy():
+            return MatrixBatch._from_ndarray(self._ndarray().transpose(0, 2, 1))
+
+        m, n = self.rows, self.cols
+        size = m * n
+        src = self.data
+
+        out = array("d", bytes(8 * len(src)))
+        o = 0
+        for k in range(self.count):
+            base = k * size
+            for j in range(n):
+                for i in range(m):
+                    out[o] = src[base + i * n + j]
+                    o += 1
+
+        return MatrixBatch(self.count, n, m, out)
+
+
+    def trace(self) -> array:
+        """
+        Returns the trace of every matrix in the batch.
+        """
+        if _numpy():
+            traces = array("d")
+            traces.frombytes(_NUMPY.trace(self._ndarray(), axis1 = 1, axis2 = 2).astype(_NUMPY.float64).tobytes())
+            return traces
+
+        m, n = self.rows, self.cols
+        diag = range(0, min(m, n) * (n + 1), n + 1)
+        data = self.data
+        return array("d", (sum(data[k * m * n + d] for d in diag) for k in range(self.count)))
+
+
+    def invert(self) -> bytearray:
+        """
+        Attempts to invert every matrix in the batch in-place, returning 
+        a `bytearray` of per-item flags indicating which inversions were 
+        successful. Singular or non-square matrices are left unchanged.
+        """
+        success = bytearray(self.count)
+        if self.rows != self.cols:
+            return success
+
+        np = _numpy()
+        if np:
+            mats = self._ndarray()
+            ok = self._nonsingular(mats)
+            mats[ok] = np.linalg.inv(mats[ok])
+            return bytearray(ok.tobytes())
+
+        n = self.rows
+        size = n * n
+        identity = [float(i == j) for i in range(n) for j in range(n)]
+
+        for k in range(self.count):
+            base = k * size
+            inv = _gauss_jordan(self.data[base:base + size].tolist(), identity[:], n, n)
+            if inv is not None:
+                self.data[base:base + size] = array("d", inv)
+                success[k] = 1
+
+        return success
+
+
+    def solve(self, rhs):
+        """
+        Solves `A X = B` for every matrix `A` in the batch and the matching 
+        `B` in `rhs`, returning a batch of solutions and a `bytearray` of 
+        per-item success flags. Solutions for singular matrices are zero.
+        """
+        if self.rows != self.cols or rhs.rows != self.rows or rhs.count != self.count:
+            raise MatrixShapeError((self.rows, self.cols), (rhs.rows, rhs.cols))
+
+        n, r = self.rows, rhs.cols
+        out = MatrixBatch(self.count, n, r)
+        success = bytearray(self.count)
+
+        np = _numpy()
+        if np:
+            mats = self._ndarray()
+            ok = self._nonsingular(mats)
+            out._ndarray()[ok] = np.linalg.solve(mats[ok], rhs._ndarray()[ok])
+            return out, bytearray(ok.tobytes())
+
+        for k in range(self.count):
+            a0, b0 = k * n * n, k * n * r
+            x = _gauss_jordan(self.data[a0:a0 + n * n].tolist(), rhs.data[b0:b0 + n * r].tolist(), n, r)
+            if x is not None:
+                out.data[b0:b0 + n * r] = array("d", x)
+                success[k] = 1
+
+        return out, success
+
+
+    @staticmethod
+    def _nonsingular(mats):
+        """
+        Returns a boolean NumPy mask of the square matrices in `mats` 
+        whose LU factorization has no zero pivot. The log-determinant is 
+        used so that well-conditioned matrices of tiny entries do not 
+        underflow to a zero determinant.
+        """
+        sign, logdet = _NUMPY.linalg.slogdet(mats)
+        return (sign != 0.0) & _NUMPY.isfinite(logdet)
+
+
+    def clone(self):
+        """
+        Creates a copy of the `MatrixBatch` object.
+        """
+        return MatrixBatch(self.count, self.rows, self.cols, array("d", self.data))
+
+
+def _gauss_jordan(a: list, b: list, n: int, r: int):
+    """
+    Reduces the row-major NxN matrix `a` to the identity with partial 
+    pivoting, applying the same operations to the row-major NxR matrix 
+    `b`. Returns `b`, or `None` if `a` is singular.
+    """
+    for c in range(n):
+        p = max(range(c, n), key = lambda i: abs(a[i * n + c]))
+        pivot = a[p * n + c]
+        if pivot == 0.0:
+            return None
+
+        if p != c:
+            a[c * n:(c + 1) * n], a[p * n:(p + 1) * n] = a[p * n:(p + 1) * n], a[c * n:(c + 1) * n]
+            b[c * r:(c + 1) * r], b[p * r:(p + 1) * r] = b[p * r:(p + 1) * r], b[c * r:(c + 1) * r]
+
+        for j in range(n):
+            a[c * n + j] /= pivot
+        for j in range(r):
+            b[c * r + j] /= pivot
+
+        for i in range(n):
+            f = a[i * n + c]
+            if i == c or f == 0.0:
+                continue
+            for j in range(n):
+                a[i * n + j] -= f * a[c * n + j]
+            for j in range(r):
+                b[i * r + j] -= f * b[c * r + j]
+
+    return b
@@ -0,0 +1,67 @@
+"""
+Benchmarks the time taken to import the Nexsys2 engine in a fresh interpreter.
+
+Each run imports `engine.nexsys2lib` in a new Python process and reports the
+median import time over several runs, failing if it exceeds the budget or if
+importing opened either Rust library:
+```
+python -m engine.nexsys2bench --runs 11 --budget 50
+```
+The command exits with status 1 if the budget is exceeded, so import-time
+regressions can be caught in CI.
+"""
+from argparse import ArgumentParser
+from json import loads
+from os import path
+from statistics import median
+from subprocess import run
+from sys import argv, executable, exit
+
+IMPORT_BUDGET_MS = 50.0
+"""
+Largest allowed median time, in milliseconds, to `import engine.nexsys2lib`.
+"""
+
+_IMPORT_SCRIPT = """
+from json import dumps
+from time import perf_counter
+start = perf_counter()
+import engine.nexsys2lib
+seconds = perf_counter() - start
+from engine.dll.geqslib_ffi import GEQSLIB_DLL
+from engine.dll.gmatlib_ffi import GMATLIB_DLL
+print(dumps({"seconds": seconds, "loaded": GEQSLIB_DLL.loaded or GMATLIB_DLL.loaded}))
+"""
+
+def time_import():
+    """
+    Imports `engine.nexsys2lib` in a fresh interpreter, returning the
+    time taken in seconds and whether a Rust library was opened.
+    """
+    root = path.dirname(path.dirname(path.abspath(__file__)))
+    proc = run([executable, "-c", _IMPORT_SCRIPT], cwd = root, capture_output = True, text = True, check = True)
+    result = loads(proc.stdout)
+    return result["seconds"], result["loaded"]
+
+def benchmark_import(runs: int = 11):
+    """
+    Times `runs` imports, returning the median time in milliseconds and
+    whether any of them opened a Rust library.
+    """
+    results = [time_import() for _ in range(runs)]
+    return median(s for s, _ in results) * 1000, any(loaded for _, loaded in results)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "Benchmarks the import time of the Nexsys2 engine.")
+    parser.add_argument("--runs", type = int, default = 11,
+        help = "number of fresh interpreters to time")
+    parser.add_argument("--budget", type = float, default = IMPORT_BUDGET_MS,
+        help = "largest allowed median import time in milliseconds")
+    opts = parser.parse_args(argv[1:])
+
+    ms, loaded = benchmark_import(opts.runs)
+    print(f"import engine.nexsys2lib: {ms:.1f} ms (budget {opts.budget:.1f} ms)")
+    if loaded:
+        print("importing the engine opened a Rust library")
+
+    exit(1 if loaded or ms > opts.budget else 0)
@@ -0,0 +1,702 @@
+"""
+Provides a Python-side Newton-Raphson solver for large, sparse blocks of
+equations. Each block's residuals are compiled once, its Jacobian sparsity
+pattern is derived from the variables each equation references, and the
+pattern's columns are colored so that structurally independent variables
+are perturbed together when finite differencing (Curtis-Powell-Reid).
+Compiled blocks, patterns and colorings are cached across Newton
+iterations and across solves.
+
+Residual trees are hash-consed across the whole block, so a subexpression
+shared by several equations is evaluated once per evaluation point.
+Subexpressions of known values only are evaluated once per solve, and each
+finite-difference pass recomputes only the shared subexpressions and
+residuals that depend on the columns it perturbs.
+
+Newton iterations run on a scaled problem: unknowns are scaled by the magnitudes
+of their guesses, and residuals by the row norms of the initial scaled
+Jacobian, so convergence is tested relative to the size of each variable
+and equation. A point is only accepted once the scaled residuals are small
+and either the unscaled residuals or the last scaled step are small too.
+"""
+from ast import (
+    parse, walk, Add, Assign, BinOp, Call, Constant, Div, Expression, List, Load, Mod, Module,
+    Mult, Name, Pow, Return, Store, Sub, Subscript, Tuple, UAdd, UnaryOp, USub, fix_missing_locations
+)
+from collections import OrderedDict
+from math import sin, cos, tan, sinh, cosh, tanh, asin, acos, atan, log, log10, fabs, pi, e, sqrt
+from re import compile as compile_regex
+from sys import float_info
+from threading import Lock
+
+COLORED_JACOBIAN_MIN_UNKNOWNS = 32
+"""
+Smallest block that Nexsys2 solves with the colored-Jacobian Newton solver
+rather than the Rust solver.
+"""
+
+BADLY_SCALED_SPREAD = 1e6
+"""
+Ratio between the largest and smallest variable scale factor above which
+Nexsys2 solves a block with the scaled Newton solver rather than the Rust
+solver, whatever its size.
+"""
+
+RESIDUAL_MARGIN = 0.0001
+"""
+Largest unscaled residual, relative to the largest solved value (or 1), 
+that Nexsys2 accepts from the scaled Newton solver.
+"""
+
+BLOCK_CACHE_SIZE = 256
+"""
+Number of compiled blocks kept between solves.
+"""
+
+_FD_STEP = sqrt(float_info.epsilon)
+
+_INF = float("inf")
+
+class SingularMatrixError(Exception):
+    def __str__(self) -> str:
+        return "cannot factorize a singular matrix"
+
+def _nexsys_if(lhs: float, op: float, rhs: float, if_true: float, if_false: float):
+    """
+    Python equivalent of the `if` function in the default Rust context.
+    `op` is the operator code emitted by the `conditionals` preprocessor.
+    """
+    if op == 1.0:
+        cond = lhs == rhs
+    elif op == 2.0:
+        cond = lhs <= rhs
+    elif op == 3.0:
+        cond = lhs >= rhs
+    elif op == 4.0:
+        cond = lhs < rhs
+    elif op == 5.0:
+        cond = lhs > rhs
+    elif op == 6.0:
+        cond = lhs != rhs
+    else:
+        raise ValueError(f"unknown comparison code: {op}")
+
+    return if_true if cond else if_false
+
+def _nexsys_pow(base: float, exponent: float):
+    """
+    Python equivalent of `^`, raising `ValueError` rather than returning
+    a `complex` for a negative base with a fractional exponent.
+    """
+    result = base ** exponent
+    if type(result) == complex:
+        raise ValueError("math domain error")
+
+    return result
+
+_FUNCTIONS = {
+    "sin":      sin,    "cos":      cos,    "tan":      tan,
+    "sinh":     sinh,   "cosh":     cosh,   "tanh":     tanh,
+    "arcsin":   asin,   "arccos":   acos,   "arctan":   atan,
+    "ln":       log,    "log10":    log10,  "abs":      fabs,
+    "if_":      _nexsys_if,
+}
+
+_CONSTANTS = { "pi": pi, "e": e }
+
+_EXPR_NODES = (Expression, BinOp, UnaryOp, Call, Name, Load, Constant, Add, Sub, Mult, Div, Pow, Mod, UAdd, USub)
+
+_EVAL_ERRORS = (ArithmeticError, ValueError, KeyError)
+
+_IF_CALL = compile_regex(r"(?<![A-Za-z0-9_])if\s*\(")
+
+def _parse_residual(equation: str):
+    """
+    Parses `lhs = rhs` into the expression tree of `lhs - (rhs)`, or
+    returns `None` if the equation uses syntax the compiler does not support.
+    """
+    sides = equation.split("=")
+    if len(sides) != 2:
+        return None
+
+    try:
+        # `if` is a Python keyword, so calls to it are renamed before parsing
+        lhs, rhs = (parse(_IF_CALL.sub("if_(", side.strip().replace("^", "**")), mode = "eval") for side in sides)
+    except SyntaxError:
+        return None
+
+    for node in walk(lhs):
+        if not _is_supported(node):
+            return None
+    for node in walk(rhs):
+        if not _is_supported(node):
+            return None
+
+    return BinOp(lhs.body, Sub(), rhs.body)
+
+def _is_supported(node):
+    if not isinstance(node, _EXPR_NODES):
+        return False
+
+    if isinstance(node, Call):
+        return isinstance(node.func, Name) and node.func.id in _FUNCTIONS and not node.keywords
+
+    if isinstance(node, Constant):
+        return type(node.value) in (int, float)
+
+    return True
+
+class _VariableRewriter:
+    """
+    Replaces variable names in a residual's tree with indexing into
+    the unknown vector `x` or the known-value vector `k`.
+    """
+
+    def __init__(self, unknowns: dict):
+        self.unknowns = unknowns
+        self.knowns = {}
+
+    def rewrite(self, node):
+        if isinstance(node, Call):
+            node.args = [self.rewrite(a) for a in node.args]
+            return node
+
+        if isinstance(node, BinOp):
+            node.left, node.right = self.rewrite(node.left), self.rewrite(node.right)
+            return node
+
+        if isinstance(node, UnaryOp):
+            node.operand = self.rewrite(node.operand)
+            return node
+
+        if isinstance(node, Name):
+            if node.id in _CONSTANTS:
+                return Constant(_CONSTANTS[node.id])
+
+            if node.id in self.unknowns:
+                return Subscript(Name("x", Load()), Constant(self.unknowns[node.id]), Load())
+
+            j = self.knowns.setdefault(node.id, len(self.knowns))
+            return Subscript(Name("k", Load()), Constant(j), Load())
+
+        return node
+
+class _SharedExpressions:
+    """
+    A block's residual trees hash-consed into a DAG, so that structurally
+    identical subexpressions are represented by a single node. Each node
+    records the unknown columns it depends on and how often it is used.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.keys = []
+        self.deps = []
+        self.refs = []
+        self.x_parent = []
+        self.roots = []
+
+    def add_root(self, tree) -> int:
+        n = self.add(tree)
+        self.refs[n] += 1
+        self.roots.append(n)
+        return n
+
+    def add(self, node) -> int:
+        """
+        Adds a rewritten expression tree, returning the id of its node.
+        """
+        if isinstance(node, Subscript):
+            key = (node.value.id, node.slice.value)
+        elif isinstance(node, Constant):
+            key = ("const", type(node.value), node.value)
+        elif isinstance(node, BinOp):
+            key = ("bin", type(node.op), self.add(node.left), self.add(node.right))
+        elif isinstance(node, UnaryOp):
+            key = ("unary", type(node.op), self.add(node.operand))
+        else:
+            key = ("call", node.func.id, *(self.add(a) for a in node.args))
+
+        n = self.ids.get(key)
+        if n is not None:
+            return n
+
+        n = self.ids[key] = len(self.keys)
+        children = key[2:] if key[0] in ("bin", "unary", "call") else ()
+        deps = frozenset([key[1]]) if key[0] == "x" else frozenset().union(*(self.deps[c] for c in children))
+
+        for c in children:
+            self.refs[c] += 1
+            self.x_parent[c] = self.x_parent[c] or bool(deps)
+
+        self.keys.append(key)
+        self.deps.append(deps)
+        self.refs.append(0)
+        self.x_parent.append(False)
+        return n
+
+    def temporaries(self):
+        """
+        Chooses the nodes to hold in temporaries, returning the known-only
+        nodes (evaluated once per solve) and the shared nodes that depend
+        on unknowns (evaluated once per evaluation point), in dependency order.
+        """
+        consts, shared = [], []
+        roots = set(self.roots)
+
+        for n, key in enumerate(self.keys):
+            if key[0] not in ("bin", "unary", "call"):
+                continue
+
+            if not self.deps[n]:
+                if self.refs[n] > 1 or self.x_parent[n] or n in roots:
+                    consts.append(n)
+            elif self.refs[n] > 1:
+                shared.append(n)
+
+        return consts, shared
+
+    def build(self, n: int, ref, top: bool = False):
+        """
+        Returns the expression tree of node `n`. `ref(n)` returns a tree
+        reading a node from its temporary, or `None` to expand it inline.
+        If `top` is set, `n` itself is always expanded.
+        """
+        held = None if top else ref(n)
+        if held is not None:
+            return held
+
+        key = self.keys[n]
+        if key[0] in ("x", "k"):
+            return Subscript(Name(key[0], Load()), Constant(key[1]), Load())
+        if key[0] == "const":
+            return Constant(key[2])
+        if key[0] == "bin" and key[1] is Pow:
+            return Call(Name("pow_", Load()), [self.build(key[2], ref), self.build(key[3], ref)], [])
+        if key[0] == "bin":
+            return BinOp(self.build(key[2], ref), key[1](), self.build(key[3], ref))
+        if key[0] == "unary":
+            return UnaryOp(key[1](), self.build(key[2], ref))
+
+        return Call(Name(key[1], Load()), [self.build(a, ref) for a in key[2:]], [])
+
+def _read(vector: str, i: int):
+    return Subscript(Name(vector, Load()), Constant(i), Load())
+
+def _function(name: str, params: str, body: list, result):
+    fn = parse(f"def {name}({params}): pass").body[0]
+    fn.body = body + [Return(result)]
+    return fn
+
+def _compile_block_functions(dag: _SharedExpressions, group_rows: list):
+    """
+    Compiles the block's DAG into `constants(k)`, returning the values of
+    known-only temporaries, `evaluate(x, k, c)`, returning the residuals and
+    shared temporaries at `x`, and one `perturbed(x, k, c, t)` function per
+    color group, returning the residuals of the group's rows while reading
+    temporaries unaffected by the group's columns from `t`.
+    """
+    consts, shared = dag.temporaries()
+    c_index = { n : i for i, n in enumerate(consts) }
+    t_index = { n : i for i, n in enumerate(shared) }
+
+    # constants(k)
+    const_ref = lambda n: Name(f"c{c_index[n]}", Load()) if n in c_index else None
+    body = [Assign([Name(f"c{i}", Store())], dag.build(n, const_ref, top = True)) for i, n in enumerate(consts)]
+    fns = [_function("constants", "k", body, List([Name(f"c{i}", Load()) for i in range(len(consts))], Load()))]
+
+    # evaluate(x, k, c)
+    def eval_ref(n):
+        if n in c_index:
+            return _read("c", c_index[n])
+        if n in t_index:
+            return Name(f"t{t_index[n]}", Load())
+        return None
+
+    body = [Assign([Name(f"t{i}", Store())], dag.build(n, eval_ref, top = True)) for i, n in enumerate(shared)]
+    fns.append(_function("evaluate", "x, k, c", body, Tuple([
+        List([dag.build(n, eval_ref) for n in dag.roots], Load()),
+        List([Name(f"t{i}", Load()) for i in range(len(shared))], Load()),
+    ], Load())))
+
+    # perturbed(x, k, c, t) for each color group
+    for g, rows in enumerate(group_rows):
+        cols = { j for _, j in rows }
+        dirty = { n for n in shared if not cols.isdisjoint(dag.deps[n]) }
+
+        def group_ref(n, dirty = dirty):
+            if n in c_index:
+                return _read("c", c_index[n])
+            if n in dirty:
+                return Name(f"t{t_index[n]}", Load())
+            if n in t_index:
+                return _read("t", t_index[n])
+            return None
+
+        body = [Assign([Name(f"t{t_index[n]}", Store())], dag.build(n, group_ref, top = True)) for n in shared if n in dirty]
+        fns.append(_function(f"perturbed{g}", "x, k, c, t", body, List([dag.build(dag.roots[r], group_ref) for r, _ in rows], Load())))
+
+    namespace = {"__builtins__": {}, "pow_": _nexsys_pow, **_FUNCTIONS}
+    exec(compile(fix_missing_locations(Module(fns, [])), "<nexsys2 block>", "exec"), namespace)
+
+    return namespace["constants"], namespace["evaluate"], [namespace[f"perturbed{g}"] for g in range(len(group_rows))]
+
+def color_columns(rows: list, n_cols: int):
+    """
+    Greedily colors the columns of a sparsity pattern so that no two
+    columns sharing a row have the same color. Columns are visited in
+    order, which gives banded patterns as few colors as their bandwidth.
+    """
+    cols = [[] for _ in range(n_cols)]
+    for r, row in enumerate(rows):
+        for j in row:
+            cols[j].append(r)
+
+    colors = [-1] * n_cols
+    for j in range(n_cols):
+        taken = { colors[c] for r in cols[j] for c in rows[r] if colors[c] >= 0 }
+        color = 0
+        while color in taken:
+            color += 1
+        colors[j] = color
+
+    return colors
+
+class JacobianPattern:
+    """
+    The sparsity pattern of a block's Jacobian, along with a column
+    coloring for grouped finite differencing.
+    """
+
+    __slots__ = ("rows", "cols", "colors", "groups", "group_rows")
+
+    def __init__(self, rows: list, n_cols: int):
+        """
+        Builds the pattern from the columns referenced by each row. For each
+        color group, `group_rows` lists the `(row, col)` pairs it perturbs.
+        """
+        self.rows = [tuple(row) for row in rows]
+        self.cols = [[] for _ in range(n_cols)]
+        for r, row in enumerate(self.rows):
+            for j in row:
+                self.cols[j].append(r)
+
+        self.colors = color_columns(self.rows, n_cols)
+        self.groups = [[] for _ in range(max(self.colors, default = -1) + 1)]
+        for j, color in enumerate(self.colors):
+            self.groups[color].append(j)
+
+        self.group_rows = [sorted((r, j) for j in group for r in self.cols[j]) for group in self.groups]
+
+def colored_jacobian(block, x: list, k: list, f0: list, hi: list = None, c: list = None, t: list = None, scales: list = None):
+    """
+    Approximates the block's Jacobian at `x` with forward differences,
+    perturbing every column in a color group at once. `f0` holds the
+    residuals at `x`, and `c` and `t` the block's known-only and shared
+    temporaries (computed if not given). Steps are sized relative to 
+    `scales` (by default 1) and those that would leave the upper bounds 
+    in `hi` are taken backwards instead. Returns the Jacobian as one 
+    `{col: value}` `dict` per row.
+    """
+    pattern = block.pattern
+    jac = [{} for _ in pattern.rows]
+
+    if c is None:
+        c = block.constants(k)
+    if t is None:
+        t = block.evaluate(x, k, c)[1]
+
+    for group, rows, perturbed in zip(pattern.groups, pattern.group_rows, block.perturbed):
+        xp = list(x)
+        steps = {}
+        for j in group:
+            h = _FD_STEP * max(abs(x[j]), 1.0 if scales is None else scales[j])
+            if hi is not None and x[j] + h > hi[j]:
+                h = -h
+            xp[j] += h
+            steps[j] = h
+
+        for (r, j), fr in zip(rows, perturbed(xp, k, c, t)):
+            jac[r][j] = (fr - f0[r]) / steps[j]
+
+    return jac
+
+class SparseLU:
+    """
+    An LU factorization with partial pivoting of a square matrix stored
+    as one `{col: value}` `dict` per row. Fill-in stays within the band
+    of banded matrices.
+    """
+
+    def __init__(self, rows: list, n: int):
+        """
+        Factorizes the matrix, raising `SingularMatrixError` if no
+        nonzero pivot exists for some column.
+        """
+        rows = [dict(row) for row in rows]
+        col_rows = [set() for _ in range(n)]
+        for i, row in enumerate(rows):
+            for j in row:
+                col_rows[j].add(i)
+
+        used = [False] * len(rows)
+        self.n = n
+        self.pivots = []
+        self.eliminations = []
+
+        for k in range(n):
+            candidates = [i for i in col_rows[k] if not used[i]]
+            p = max(candidates, key = lambda i: abs(rows[i][k]), default = None)
+            if p is None or rows[p][k] == 0.0:
+                raise SingularMatrixError
+
+            used[p] = True
+            prow = rows[p]
+            pivot = prow[k]
+            elims = []
+
+            for i in candidates:
+                if i == p:
+                    continue
+
+                row = rows[i]
+                f = row.pop(k) / pivot
+                col_rows[k].discard(i)
+                if f == 0.0:
+                    continue
+
+                for j, v in prow.items():
+                    if j == k:
+                        continue
+                    if j in row:
+                        row[j] -= f * v
+                    else:
+                        row[j] = -f * v
+                        col_rows[j].add(i)
+
+                elims.append((i, f))
+
+            self.pivots.append(p)
+            self.eliminations.append(elims)
+
+        self.rows = rows
+
+    def solve(self, b: list):
+        """
+        Solves `A x = b` for `x` using the factorization.
+        """
+        b = list(b)
+        for p, elims in zip(self.pivots, self.eliminations):
+            bp = b[p]
+            for i, f in elims:
+                b[i] -= f * bp
+
+        x = [0.0] * self.n
+        for k in range(self.n - 1, -1, -1):
+            row = self.rows[self.pivots[k]]
+            acc = b[self.pivots[k]]
+            for j, v in row.items():
+                if j != k:
+                    acc -= v * x[j]
+            x[k] = acc / row[k]
+
+        return x
+
+class CompiledBlock:
+    """
+    A block of equations compiled for the Python Newton solver.
+    """
+
+    __slots__ = ("unknowns", "knowns", "pattern", "constants", "evaluate", "perturbed")
+
+    def __init__(self, unknowns: tuple, knowns: tuple, pattern: JacobianPattern, constants, evaluate, perturbed: list):
+        self.unknowns  = unknowns
+        self.knowns    = knowns
+        self.pattern   = pattern
+        self.constants = constants
+        self.evaluate  = evaluate
+        self.perturbed = perturbed
+
+    def residuals(self, x: list, k: list):
+        """
+        Returns the residuals of the block at `x`, given the values `k` of
+        `self.knowns`.
+        """
+        return self.evaluate(x, k, self.constants(k))[0]
+
+_BLOCK_CACHE = OrderedDict()
+_BLOCK_CACHE_LOCK = Lock()
+
+def compile_block(equations: tuple, unknowns: tuple):
+    """
+    Compiles a square block of equations in the given unknowns, or returns
+    `None` if any equation uses syntax the compiler does not support.
+    Compiled blocks are cached by their equations and unknowns.
+    """
+    key = (equations, unknowns)
+    with _BLOCK_CACHE_LOCK:
+        if key in _BLOCK_CACHE:
+            _BLOCK_CACHE.move_to_end(key)
+            return _BLOCK_CACHE[key]
+
+    rewriter = _VariableRewriter({ name : j for j, name in enumerate(unknowns) })
+    dag = _SharedExpressions()
+
+    for eqn in equations:
+        tree = _parse_residual(eqn)
+        if tree is None:
+            return None
+
+        dag.add_root(rewriter.rewrite(tree))
+
+    pattern = JacobianPattern([sorted(dag.deps[n]) for n in dag.roots], len(unknowns))
+    block = CompiledBlock(
+        unknowns,
+        tuple(rewriter.knowns),
+        pattern,
+        *_compile_block_functions(dag, pattern.group_rows)
+    )
+
+    with _BLOCK_CACHE_LOCK:
+        _BLOCK_CACHE[key] = block
+        _BLOCK_CACHE.move_to_end(key)
+        while len(_BLOCK_CACHE) > BLOCK_CACHE_SIZE:
+            _BLOCK_CACHE.popitem(last = False)
+
+    return block
+
+def variable_scales(guess: list, lo: list, hi: list):
+    """
+    Returns a scale factor for each unknown: the magnitude of its guess 
+    clamped to `[lo, hi]`, or 1 if this is zero. Bounds only clamp the 
+    guess, so a wide domain does not inflate the scale.
+    """
+    return [abs(min(max(g, l), h)) or 1.0 for g, l, h in zip(guess, lo, hi)]
+
+def equation_scales(jac: list, scales: list):
+    """
+    Returns a scale factor for each residual: the reciprocal of the largest
+    entry in its row of the Jacobian with columns scaled by `scales`, or 1
+    if the row is zero.
+    """
+    factors = []
+    for row in jac:
+        norm = max((abs(v * scales[j]) for j, v in row.items()), default = 0.0)
+        factors.append(1.0 / norm if 0.0 < norm < _INF else 1.0)
+
+    return factors
+
+def newton_solve(
+    block: CompiledBlock,
+    k: list,
+    guess: list,
+    lo: list,
+    hi: list,
+    margin: float = 0.0001,
+    limit: int = 100
+):
+    """
+    Solves the block with Newton-Raphson, starting from `guess` and keeping
+    each unknown within `[lo, hi]`. `k` holds the values of `block.knowns`.
+    Unknowns and residuals are scaled as described above, and the block is
+    converged once every scaled residual is below `margin` and either every 
+    unscaled residual or every component of the last scaled step is too. 
+    Returns the solution vector and the number of iterations taken, or `None` 
+    if the solver fails to converge.
+    """
+    clamp = lambda vals: [min(max(v, l), h) for v, l, h in zip(vals, lo, hi)]
+    scaled_norm = lambda vals: max((abs(w * v) for w, v in zip(weights, vals)), default = 0.0)
+    converged = lambda: norm < margin and (step_norm < margin or max(map(abs, f), default = 0.0) < margin)
+
+    x = clamp(guess)
+    scales = variable_scales(guess, lo, hi)
+    try:
+        c = block.constants(k)
+        f, t = block.evaluate(x, k, c)
+        jac = colored_jacobian(block, x, k, f, hi, c, t, scales)
+    except _EVAL_ERRORS:
+        return None
+
+    weights = equation_scales(jac, scales)
+    norm = scaled_norm(f)
+    step_norm = _INF
+
+    for iteration in range(limit):
+        if converged():
+            return x, iteration
+
+        try:
+            if jac is None:
+                jac = colored_jacobian(block, x, k, f, hi, c, t, scales)
+
+            lu = SparseLU([{ j : w * v * scales[j] for j, v in row.items() } for w, row in zip(weights, jac)], len(x))
+            dx = [s * dy for s, dy in zip(scales, lu.solve([-w * v for w, v in zip(weights, f)]))]
+        except _EVAL_ERRORS + (SingularMatrixError,):
+            return None
+
+        # Damp the step until the residual stops growing
+        step = 1.0
+        while True:
+            x_new = clamp([v + step * d for v, d in zip(x, dx)])
+            try:
+                f_new, t_new = block.evaluate(x_new, k, c)
+                norm_new = scaled_norm(f_new)
+            except _EVAL_ERRORS:
+                norm_new = _INF
+
+            if norm_new <= norm or step < 1e-4:
+                break
+            step /= 2
+
+        if norm_new == _INF:
+            return None
+
+        step_norm = max((abs(a - b) / s for a, b, s in zip(x_new, x, scales)), default = 0.0)
+        x, f, t, norm, jac = x_new, f_new, t_new, norm_new, None
+
+    if converged():
+        return x, limit
+
+    return None
+
+def max_residual(block: CompiledBlock, x: list, k: list):
+    """
+    Returns the largest unscaled residual of the block at `x`, where `k` 
+    holds the values of `block.knowns`.
+    """
+    return max(map(abs, block.evaluate(x, k, block.constants(k))[0]), default = 0.0)
+
+def block_sensitivities(block: CompiledBlock, x: list, k: list, dk: list):
+    """
+    Applies the implicit function theorem to a solved block. Given the solution
+    `x`, the values `k` of `block.knowns` and the derivatives `dk[j]` of each
+    known value with respect to a set of parameters (or `None` for knowns that
+    do not depend on them), returns the derivatives of each unknown with respect
+    to the same parameters. The block's Jacobian is factorized once and reused
+    for every parameter.
+    """
+    n_params = len(next(d for d in dk if d is not None))
+
+    c = block.constants(k)
+    f, t = block.evaluate(x, k, c)
+    lu = SparseLU(colored_jacobian(block, x, k, f, None, c, t), len(x))
+
+    # Chain the partial derivatives of the residuals in each dependent known
+    rhs = [[0.0] * n_params for _ in f]
+    for j, dkj in enumerate(dk):
+        if dkj is None:
+            continue
+
+        kp = list(k)
+        h = _FD_STEP * max(abs(k[j]), 1.0)
+        kp[j] += h
+        fp = block.evaluate(x, kp, block.constants(kp))[0]
+
+        for row, v, v0 in zip(rhs, fp, f):
+            dfdk = (v - v0) / h
+            if dfdk != 0.0:
+                for m, d in enumerate(dkj):
+                    row[m] -= dfdk * d
+
+    cols = [lu.solve([row[m] for row in rhs]) for m in range(n_params)]
+    return [[col[i] for col in cols] for i in range(len(x))]
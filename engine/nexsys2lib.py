@@ -1,9 +1,18 @@
 """
 Contains code for solving equations with Nexsys2 as well as extending its functionality.
 """
-from dataclasses import dataclass
+from collections import OrderedDict
+from os import path
 from re import findall, DOTALL, IGNORECASE
-from engine.geqslib import create_context_with, solve_equation, SystemBuilder, WILL_CONSTRAIN, WILL_OVERCONSTRAIN
+from sys import stdin
+from threading import Lock
+from time import perf_counter
+from engine.geqslib import ContextPool, solve_equation, SystemBuilder, WILL_CONSTRAIN, WILL_OVERCONSTRAIN
+from engine.nexsys2jacobian import (
+    BADLY_SCALED_SPREAD, COLORED_JACOBIAN_MIN_UNKNOWNS, RESIDUAL_MARGIN, 
+    block_sensitivities, compile_block, max_residual, newton_solve, variable_scales
+)
+from engine.nexsys2symtab import DeclaredVariable, KnownValues, SymbolTable
 
 _SUCCESS = True
 
@@ -30,11 +39,21 @@ RUST_KNOWN_VALUES = [
 Values known in the default context value created in Rust.
 """
 
-@dataclass
-class DeclaredVariable:
-    guess:   float = 1.0
-    min_val: float = float("-inf")
-    max_val: float = float("inf")
+_RUST_KNOWN_VALUES = frozenset(RUST_KNOWN_VALUES)
+
+INDEX_SEPARATOR = "__"
+"""
+Separates the base name of an indexed variable from its index, so
+that `t[3]` is named `t__3` and `t[-1]` is named `t__m1` internally.
+"""
+
+def indexed_name(base: str, index: int):
+    """
+    Returns the internal name of the indexed variable `base[index]`.
+    """
+    if index < 0:
+        return f"{base}{INDEX_SEPARATOR}m{-index}"
+    return f"{base}{INDEX_SEPARATOR}{index}"
 
 def nexsys_findall(pattern: str, string: str):
     """
@@ -48,115 +67,730 @@ def nexsys_findall(pattern: str, string: str):
     
     return findall(nexsys_pattern, string, IGNORECASE | DOTALL)
 
-def _try_solve_single_unknown_equation(eqn_pool: list, ctx_dict: dict, declared_dict: dict):
+def preprocessor(*, after: tuple = (), triggers: tuple = (), line_local: bool = False, line_map: bool = False):
+    """
+    Decorator declaring how a preprocessor is scheduled by `NexsysPreProcessorScheduler`.
+
+    - `after`: names of preprocessors that must run before this one, if scheduled.
+    - `triggers`: substrings of the directives this preprocessor consumes. It is 
+      skipped if none of them appear in the system.
+    - `line_local`: whether the preprocessor only rewrites lines containing a trigger, 
+      leaving the number of lines unchanged. Only those lines are passed to it.
+    - `line_map`: whether the preprocessor returns `(system, origins)`, where `origins[i]` 
+      is the index of the input line that output line `i` came from. Preprocessors that 
+      add or remove lines should declare this so errors can cite source line numbers.
+
+    Scheduled preprocessors must be deterministic in their input text, since their 
+    output and their changes to the context and declared dicts are memoized.
+    """
+    def decorate(pp):
+        pp.after = tuple(after)
+        pp.triggers = tuple(triggers)
+        pp.line_local = line_local
+        pp.line_map = line_map
+        return pp
+
+    return decorate
+
+_DECLARED_DEFAULTS = (1.0, float("-inf"), float("inf"))
+
+class NexsysPreProcessorScheduler:
+    """
+    Runs preprocessors in dependency order, skipping those whose triggers are absent 
+    from the system and memoizing each stage's output by a hash of its input. Stages 
+    declared as line-local only see their directive lines, so a system in which only 
+    the equations change reuses every directive stage from the cache.
+    """
+
+    def __init__(self, preprocessors: list, cache_size: int = 32):
+        """
+        Schedules the given preprocessors, which may be declared with `preprocessor`. 
+        Undeclared preprocessors always run, in the order given.
+        """
+        self.stages = NexsysPreProcessorScheduler._order(preprocessors)
+        self.cache_size = cache_size
+        self.caches = { pp : OrderedDict() for pp in self.stages }
+        self.lock = Lock()
+
+    @staticmethod
+    def _order(preprocessors: list):
+        """
+        Orders preprocessors so each runs after its dependencies, otherwise 
+        keeping the given order.
+        """
+        by_name = { pp.__name__ : pp for pp in preprocessors }
+        ordered, placed = [], set()
+
+        while len(ordered) < len(preprocessors):
+            for pp in preprocessors:
+                deps = [by_name[d] for d in getattr(pp, "after", ()) if d in by_name]
+                if pp not in placed and all(d in placed for d in deps):
+                    ordered.append(pp)
+                    placed.add(pp)
+                    break
+            else:
+                raise ValueError("preprocessor dependencies are cyclic")
+
+        return ordered
+
+    def __iter__(self):
+        return iter(self.stages)
+
+    def __call__(self, system: str, ctx_dict: dict, declared_dict: dict):
+        """
+        Runs every scheduled stage over `system`, returning the preprocessed system.
+        """
+        return self.run(system, ctx_dict, declared_dict)[0]
+
+    def run(self, system: str, ctx_dict: dict, declared_dict: dict):
+        """
+        Runs every scheduled stage over `system`, returning the preprocessed system 
+        and the source line number (or `None`, if unknown) of each of its lines.
+        """
+        origins = _source_lines(system)
+
+        for pp in self.stages:
+            triggers = getattr(pp, "triggers", ())
+            if triggers and not any(t in system for t in triggers):
+                continue
+
+            if getattr(pp, "line_local", False):
+                lines = system.split("\n")
+                hits = [i for i, line in enumerate(lines) if any(t in line for t in triggers)]
+                output = self._run_stage(pp, "\n".join(lines[i] for i in hits), ctx_dict, declared_dict).split("\n")
+
+                if len(output) == len(hits):
+                    for i, line in zip(hits, output):
+                        lines[i] = line
+                    system = "\n".join(lines)
+                    continue
+
+            output = self._run_stage(pp, system, ctx_dict, declared_dict)
+            system, origins = _map_lines(pp, system, output, origins)
+
+        return system, origins
+
+    def _run_stage(self, pp, system: str, ctx_dict: dict, declared_dict: dict):
+        """
+        Runs a single stage, or replays its memoized output and side effects.
+        """
+        from hashlib import blake2b # Imported on first use to keep `import` fast
+
+        key = blake2b(system.encode("utf-8"), digest_size = 16).digest()
+        cache = self.caches[pp]
+
+        with self.lock:
+            cached = cache.get(key)
+            if cached is not None:
+                cache.move_to_end(key)
+
+        if cached is not None:
+            output, ctx_changes, declared_changes = cached
+            ctx_dict.update(ctx_changes)
+
+            for var, fields in declared_changes.items():
+                if var not in declared_dict:
+                    declared_dict[var] = DeclaredVariable()
+                for field, val in fields.items():
+                    setattr(declared_dict[var], field, val)
+
+            return output
+
+        ctx_before = dict(ctx_dict)
+        declared_before = { var : (d.guess, d.min_val, d.max_val) for var, d in declared_dict.items() }
+
+        output = pp(system, ctx_dict, declared_dict)
+
+        missing = object()
+        ctx_changes = { var : val for var, val in ctx_dict.items() if ctx_before.get(var, missing) != val }
+        declared_changes = {}
+        for var, d in declared_dict.items():
+            before = declared_before.get(var, _DECLARED_DEFAULTS)
+            after = (d.guess, d.min_val, d.max_val)
+            fields = { f : v for f, b, v in zip(("guess", "min_val", "max_val"), before, after) if b != v }
+            if fields or var not in declared_before:
+                declared_changes[var] = fields
+
+        with self.lock:
+            cache[key] = (output, ctx_changes, declared_changes)
+            while len(cache) > self.cache_size:
+                cache.popitem(last = False)
+
+        return output
+
+def _source_lines(system: str):
+    return list(range(1, system.count("\n") + 2))
+
+def _map_lines(pp, system: str, output: any, origins: list):
+    """
+    Returns a preprocessor's output text and the source line numbers of its lines, 
+    given its input text and the source line numbers of the input's lines.
+    """
+    if getattr(pp, "line_map", False):
+        output, stage_origins = output
+        return output, [origins[i] for i in stage_origins]
+
+    if output.count("\n") == system.count("\n"):
+        return output, origins
+
+    return output, [None] * (output.count("\n") + 1)
+
+def _run_preprocessors(system: str, preprocessors: any, ctx_dict: dict, declared_dict: dict):
+    """
+    Runs a `NexsysPreProcessorScheduler` or a plain list of preprocessors over `system`, 
+    returning the preprocessed system and the source line number of each of its lines.
+    """
+    if isinstance(preprocessors, NexsysPreProcessorScheduler):
+        return preprocessors.run(system, ctx_dict, declared_dict)
+
+    origins = _source_lines(system)
+    for pp in preprocessors:
+        system, origins = _map_lines(pp, system, pp(system, ctx_dict, declared_dict), origins)
+
+    return system, origins
+
+class _Equation:
+    """
+    An equation in the solver's pool, holding its text encoded for the 
+    FFI, the line of the source system it came from and the ids of the 
+    variables it references.
+    """
+
+    __slots__ = ("text", "encoded", "line", "var_ids")
+
+    def __init__(self, text: str, table: SymbolTable, line: int = None):
+        self.text    = text
+        self.encoded = bytes(text, "utf-8")
+        self.line    = line
+        self.var_ids = tuple({ 
+            table.intern(var) : None 
+            for var in nexsys_findall(r"(?<![a-z0-9_.])@V", text) # skip exponents like 1e5
+            if var not in _RUST_KNOWN_VALUES 
+        })
+
+class NexsysStructureError(Exception):
+    """
+    Raised when a system cannot be fully constrained, as shown by a maximum 
+    matching of its equations to its unknowns.
+    """
+
+    def __init__(self, unmatched_equations: list, unmatched_variables: list) -> None:
+        super().__init__()
+
+        self.unmatched_equations = unmatched_equations
+        self.unmatched_variables = unmatched_variables
+
+    def __str__(self) -> str:
+        lines = []
+        if self.unmatched_equations:
+            lines.append(f"{len(self.unmatched_equations)} equation(s) over-constrain the system:")
+            lines.extend(f"    line {'?' if n is None else n}: {text.strip()}" for n, text in self.unmatched_equations[:10])
+        if self.unmatched_variables:
+            lines.append(f"{len(self.unmatched_variables)} variable(s) are not constrained:")
+            lines.append("    " + ", ".join(self.unmatched_variables[:10]))
+        return "\n".join(lines)
+
+def _maximum_matching(adj: list, n_right: int):
+    """
+    Finds a maximum matching of a bipartite graph with Hopcroft-Karp, where 
+    `adj[u]` lists the right vertices adjacent to left vertex `u`. Returns 
+    the match of every left vertex and every right vertex, or -1 if unmatched.
+    """
+    n_left = len(adj)
+    match_l = [-1] * n_left
+    match_r = [-1] * n_right
+
+    # Start from a greedy matching
+    for u in range(n_left):
+        for v in adj[u]:
+            if match_r[v] == -1:
+                match_l[u], match_r[v] = v, u
+                break
+
+    while True:
+        # Layer the graph by alternating path length from free left vertices
+        dist = [-1] * n_left
+        queue = [u for u in range(n_left) if match_l[u] == -1]
+        for u in queue:
+            dist[u] = 0
+
+        found, head = False, 0
+        while head < len(queue):
+            u = queue[head]
+            head += 1
+            for v in adj[u]:
+                w = match_r[v]
+                if w == -1:
+                    found = True
+                elif dist[w] == -1:
+                    dist[w] = dist[u] + 1
+                    queue.append(w)
+
+        if not found:
+            return match_l, match_r
+
+        # Augment along vertex-disjoint shortest paths with an iterative DFS
+        edge = [0] * n_left
+        for root in range(n_left):
+            if match_l[root] != -1:
+                continue
+
+            stack, chosen = [root], []
+            while stack:
+                u = stack[-1]
+                while edge[u] < len(adj[u]):
+                    v = adj[u][edge[u]]
+                    edge[u] += 1
+                    w = match_r[v]
+
+                    if w == -1:
+                        for x, y in zip(stack, chosen + [v]):
+                            match_l[x], match_r[y] = y, x
+                        stack = []
+                        break
+
+                    if dist[w] == dist[u] + 1:
+                        chosen.append(v)
+                        stack.append(w)
+                        break
+                else:
+                    dist[u] = -1
+                    stack.pop()
+                    if chosen:
+                        chosen.pop()
+
+def check_structure(equations: list, table: SymbolTable):
+    """
+    Matches equations to the unknowns they reference in near-linear time, raising 
+    `NexsysStructureError` with the unmatched equations and variables if the 
+    system is over- or under-constrained.
+    """
+    known = table.known
+    columns = {}
+    adj = [[columns.setdefault(vid, len(columns)) for vid in eqn.var_ids if not known[vid]] for eqn in equations]
+
+    match_l, match_r = _maximum_matching(adj, len(columns))
+    names = { col : table.names[vid] for vid, col in columns.items() }
+
+    unmatched_equations = [(eqn.line, eqn.text) for eqn, m in zip(equations, match_l) if m == -1]
+    unmatched_variables = [names[col] for col, m in enumerate(match_r) if m == -1]
+
+    if unmatched_equations or unmatched_variables:
+        raise NexsysStructureError(unmatched_equations, unmatched_variables)
+
+def _record_step(trace: any, kind: str, method: str, block: list, unknowns: list, table: SymbolTable, solved: bool, iterations: int, seconds: float):
+    """
+    Records a solve attempt on `trace` with the inputs needed to replay it.
+    """
+    known = table.known
+    trace.record(kind, method,
+        equations = [x.text for x in block],
+        unknowns = [table.names[vid] for vid in unknowns],
+        knowns = { table.names[vid] : table.values[vid] for x in block for vid in x.var_ids if known[vid] },
+        guesses = [table.guesses[vid] for vid in unknowns],
+        mins = [table.min_vals[vid] for vid in unknowns],
+        maxes = [table.max_vals[vid] for vid in unknowns],
+        declared = [bool(table.declared[vid]) for vid in unknowns],
+        solved = solved,
+        iterations = iterations,
+        seconds = seconds)
+
+def _try_solve_single_unknown_equation(eqn_pool: list, table: SymbolTable, ctx_pool: ContextPool, trace: any = None):
     """
     Tries to solve ONE single-unknown equation in the given pool. This function will 
     iterate through the given pool until it finds a solvable equation, updating the 
-    equation pool and caller context if it can find a solution.
+    equation pool and symbol table if it can find a solution.
     """
+    known = table.known
+    ctx_dict = table.known_values()
+
     for i, eqn in enumerate(eqn_pool): 
 
-        unknowns = [var for var in nexsys_findall("@V", eqn) if var not in ctx_dict and var not in RUST_KNOWN_VALUES]
-        if len(set(unknowns)) != 1:
-            return False
+        unknowns = [vid for vid in eqn.var_ids if not known[vid]]
+        if len(unknowns) != 1:
+            continue
         
-        var_info = DeclaredVariable()
-        if unknowns[0] in declared_dict:
-            var_info = declared_dict[unknowns]
+        vid = unknowns[0]
 
         # Try to solve equation...
-        maybe_soln = solve_equation(eqn, 
-            ctx = create_context_with(ctx_dict),
-            guess = var_info.guess,
-            soln_min = var_info.min_val,
-            soln_max = var_info.max_val)
+        with ctx_pool.borrow(ctx_dict) as ctx:
+            start = perf_counter()
+            maybe_soln = solve_equation(eqn.encoded, 
+                ctx = ctx,
+                guess = table.guesses[vid],
+                soln_min = table.min_vals[vid],
+                soln_max = table.max_vals[vid])
+            seconds = perf_counter() - start
+
+        if trace is not None:
+            _record_step(trace, "single", "rust", [eqn], unknowns, table, maybe_soln != None, None, seconds)
 
         # ...if successful
         if maybe_soln != None:
             ctx_dict.update(maybe_soln.soln_dict)   # ...add information to caller's context
+            table.record_block((eqn,), (vid,))      # ...note the solve order
             eqn_pool.pop(i)                         # ...remove equation from pool
             return True                             # ...alert caller of success and exit
         
     # If no equations are solvable, indicate failure.
     return False
 
-def _try_solve_subsystem_of_equations(eqn_pool: list, ctx_dict: dict, declared_dict: dict):
+def _is_badly_scaled(unknowns: list, table: SymbolTable):
+    """
+    Returns whether the scale factors of the given unknowns, derived from their 
+    guesses, span more than `BADLY_SCALED_SPREAD`.
+    """
+    scales = variable_scales(
+        [table.guesses[vid] for vid in unknowns],
+        [table.min_vals[vid] for vid in unknowns],
+        [table.max_vals[vid] for vid in unknowns])
+
+    return max(scales) > BADLY_SCALED_SPREAD * min(scales)
+
+def _try_solve_sparse_block(block: list, unknowns: list, table: SymbolTable, trace: any = None):
+    """
+    Tries to solve a constrained block of equations with the Python Newton solver, 
+    which finite-differences its Jacobian by groups of structurally independent 
+    variables and scales unknowns and residuals. Returns the number of Newton 
+    iterations taken, or `None` if the block cannot be compiled, does not converge
+    or leaves an unscaled residual above `RESIDUAL_MARGIN`. Only the Newton solve 
+    is timed when recording a trace.
+    """
+    if len(block) != len(unknowns):
+        return None
+
+    compiled = compile_block(tuple(x.text for x in block), tuple(table.names[vid] for vid in unknowns))
+    if compiled is None:
+        return None
+
+    ctx_dict = table.known_values()
+    if any(name not in ctx_dict for name in compiled.knowns):
+        return None
+
+    # Any failure to evaluate the block leaves it to the Rust solver
+    k = [ctx_dict[name] for name in compiled.knowns]
+    start = perf_counter()
+    try:
+        maybe_soln = newton_solve(compiled, k,
+            [table.guesses[vid] for vid in unknowns],
+            [table.min_vals[vid] for vid in unknowns],
+            [table.max_vals[vid] for vid in unknowns])
+    except Exception:
+        maybe_soln = None
+    seconds = perf_counter() - start
+
+    # ...as does a solution that only looks converged after scaling
+    if maybe_soln is not None:
+        x = maybe_soln[0]
+        try:
+            if max_residual(compiled, x, k) > RESIDUAL_MARGIN * max(1.0, *map(abs, x)):
+                maybe_soln = None
+        except Exception:
+            maybe_soln = None
+
+    if trace is not None:
+        iterations = None if maybe_soln is None else maybe_soln[1]
+        _record_step(trace, "block", "sparse", block, unknowns, table, maybe_soln is not None, iterations, seconds)
+
+    if maybe_soln is None:
+        return None
+
+    for vid, val in zip(unknowns, maybe_soln[0]):
+        table.set_value(vid, val)
+
+    return maybe_soln[1]
+
+def _try_solve_subsystem_of_equations(eqn_pool: list, table: SymbolTable, ctx_pool: ContextPool, trace: any = None):
     """
     Tries to identify and solve a constrained system of equations within `eqn_pool`. 
     This function will iterate through the given pool until it finds a solvable system, 
-    updating the equation pool and caller context if it can find a solution.
+    updating the equation pool and symbol table if it can find a solution.
     """
+    known = table.known
+    ctx_dict = table.known_values()
+
     for eqn in eqn_pool:
-        builder = SystemBuilder(eqn, create_context_with(ctx_dict))
-        sub_pool = [x for x in eqn_pool if x != eqn]
-        still_learning = True
+        with ctx_pool.borrow(ctx_dict) as ctx, SystemBuilder(eqn.encoded, ctx) as builder:
+            block = [eqn]
+            sub_pool = [x for x in eqn_pool if x is not eqn]
+            still_learning = True
 
-        # Identify if a constrained subsystem exists
-        while still_learning:
-            still_learning = False
+            # Identify if a constrained subsystem exists
+            while still_learning:
+                still_learning = False
 
-            for i in range(len(sub_pool)):
-                constraint_status = builder.try_constrain_with(sub_pool[i])
+                for i in range(len(sub_pool)):
+                    constraint_status = builder.try_constrain_with(sub_pool[i].encoded)
 
-                if WILL_CONSTRAIN == constraint_status:
-                    sub_pool.pop(i)
-                    still_learning = True
-                    break
+                    if WILL_CONSTRAIN == constraint_status:
+                        block.append(sub_pool.pop(i))
+                        still_learning = True
+                        break
 
-                elif WILL_OVERCONSTRAIN == constraint_status:
-                    break
+                    elif WILL_OVERCONSTRAIN == constraint_status:
+                        break
         
-        # Add declared domains and guesses, and solve
-        if builder.is_fully_constrained():
-            system = builder.build_system()
+            # Add declared domains and guesses, and solve
+            if builder.is_fully_constrained():
+                unknowns = sorted({ vid for x in block for vid in x.var_ids if not known[vid] })
+
+                # Large or badly scaled blocks are solved in Python, falling back to Rust
+                if len(unknowns) >= COLORED_JACOBIAN_MIN_UNKNOWNS or _is_badly_scaled(unknowns, table):
+                    iterations = _try_solve_sparse_block(block, unknowns, table, trace)
+                    if iterations is not None:
+                        table.record_block(block, tuple(unknowns))
+                        eqn_pool.clear()
+                        eqn_pool.extend(sub_pool)
+
+                        return True
+
+                start = perf_counter()
+                system = builder.build_system()
+
+                for vid in unknowns:
+                    if table.declared[vid]:
+                        system.specify_variable(table.encoded[vid], 
+                            guess = table.guesses[vid], 
+                            min = table.min_vals[vid], 
+                            max = table.max_vals[vid])
 
-            for var in declared_dict:
-                system.specify_variable(var, 
-                    guess = declared_dict[var].guess, 
-                    min = declared_dict[var].min_val, 
-                    max = declared_dict[var].max_val)
+                maybe_soln = system.solve_system()
 
-            maybe_soln = system.solve_system()
+                if trace is not None:
+                    _record_step(trace, "block", "rust", block, unknowns, table, maybe_soln != None, None, perf_counter() - start)
 
-            if maybe_soln != None:
-                ctx_dict.update(maybe_soln.soln_dict)
-                eqn_pool.clear()
-                eqn_pool.extend(sub_pool)
+                if maybe_soln != None:
+                    ctx_dict.update(maybe_soln.soln_dict)
+                    table.record_block(block, tuple(unknowns))
+                    eqn_pool.clear()
+                    eqn_pool.extend(sub_pool)
 
-                return True
+                    return True
         
-        # ...or just abort if no constrained system exists 
-        else:
-            return False
+            # ...or just abort if no constrained system exists 
+            else:
+                return False
 
-def nexsys2(system: str, preprocessors: list = []):
+class NexsysSolution(KnownValues):
     """
-    The process for solving a system of equations in Nexsys2. This function automatically 
-    calls any preprocessors scheduled with the `NexsysPreProcessorScheduler` prior to solving.
+    The solved values of a system, which can also report their derivatives 
+    with respect to the system's known values.
     """
-    ctx_dict = {}
-    declared_dict = {}
 
-    # Run preprocessors in order, mutating system and context along the way
-    for pp in preprocessors:
-        system = pp(system, ctx_dict, declared_dict)
+    __slots__ = ()
 
-    # Split plain text into lines with 1 equation each
-    equations = [line for line in system.split("\n") if "=" in line]
+    def sensitivities(self, params: list, outputs: list = None):
+        """
+        Returns the derivatives of each of `outputs` (by default, every solved 
+        value) with respect to each of the known values named in `params` 
+        (typically `const` values), as `{output : {param : derivative}}`. 
+
+        Derivatives are propagated through the solved blocks in solve order 
+        with the implicit function theorem, factorizing each dependent block's 
+        Jacobian once, rather than re-solving the system per parameter.
+        """
+        table = self.table
+        if table.blocks is None:
+            raise ValueError("solve order was not recorded for this solution")
+
+        derivs = {}
+        for m, name in enumerate(params):
+            if name not in self:
+                raise KeyError(name)
+            derivs[table.ids[name]] = [float(m == i) for i in range(len(params))]
+
+        for equations, unknowns, knowns in table.blocks:
+            if any(vid in derivs for vid in unknowns) or not any(vid in derivs for vid in knowns):
+                continue
+
+            compiled = compile_block(equations, tuple(table.names[vid] for vid in unknowns))
+            if compiled is None:
+                raise ValueError(f"cannot differentiate block: {'; '.join(equations)}")
+
+            dk = [derivs.get(table.ids[name]) for name in compiled.knowns]
+            if all(d is None for d in dk):
+                continue
 
+            x = [table.values[vid] for vid in unknowns]
+            k = [self[name] for name in compiled.knowns]
+            for vid, d in zip(unknowns, block_sensitivities(compiled, x, k, dk)):
+                derivs[vid] = d
+
+        if outputs is None:
+            outputs = [table.names[vid] for equations, unknowns, knowns in table.blocks for vid in unknowns]
+
+        zeros = [0.0] * len(params)
+        result = {}
+        for name in outputs:
+            if name not in self:
+                raise KeyError(name)
+            result[name] = dict(zip(params, derivs.get(table.ids[name], zeros)))
+
+        return result
+
+def _solve_pool(equations: list, table: SymbolTable, ctx_pool: ContextPool, trace: any = None):
+    """
+    Solves equations from the pool until no more can be solved, 
+    leaving any unsolvable equations in the pool.
+    """
     # NOTE: Using if-else to support pre-3.11 syntax. A match may be better here in the future.
     while True:
 
-        if _SUCCESS == _try_solve_single_unknown_equation(equations, ctx_dict, declared_dict):
+        if _SUCCESS == _try_solve_single_unknown_equation(equations, table, ctx_pool, trace):
             continue
 
-        elif _SUCCESS == _try_solve_subsystem_of_equations(equations, ctx_dict, declared_dict):
+        elif _SUCCESS == _try_solve_subsystem_of_equations(equations, table, ctx_pool, trace):
             continue
 
         else:
             break
 
+def nexsys2(system: str, preprocessors: list = [], trace: any = None):
+    """
+    The process for solving a system of equations in Nexsys2. This function automatically 
+    calls any preprocessors scheduled with the `NexsysPreProcessorScheduler` prior to solving.
+    A plain list of preprocessors is run in the order given.
+
+    Solver state is kept in a `SymbolTable`. Preprocessors receive and the solver returns 
+    `dict`-like views of it, the latter a `NexsysSolution` that can also compute sensitivities. 
+    If a `SolveTrace` is given, every solve attempt is recorded on it.
+    """
+    table = SymbolTable()
+    table.blocks = []
+    ctx_dict = NexsysSolution(table)
+    declared_dict = table.declared_variables()
+    ctx_pool = ContextPool()
+
+    # Run preprocessors in order, mutating system and context along the way
+    system, origins = _run_preprocessors(system, preprocessors, ctx_dict, declared_dict)
+
+    # Split plain text into lines with 1 equation each
+    equations = [_Equation(line, table, n) for line, n in zip(system.split("\n"), origins) if "=" in line]
+
+    # Fail fast on systems that cannot be constrained before doing any numeric work
+    check_structure(equations, table)
+
+    _solve_pool(equations, table, ctx_pool, trace)
+    ctx_pool.clear()
+
     if len(equations) != 0:
         raise Exception
     
     return ctx_dict
+
+def nexsys2_preprocess(system: str, preprocessors: list = []):
+    """
+    Runs only the preprocessors over a system, returning the preprocessed system.
+    """
+    table = SymbolTable()
+    return _run_preprocessors(system, preprocessors, table.known_values(), table.declared_variables())[0]
+
+def nexsys2_check(system: str, preprocessors: list = []):
+    """
+    Preprocesses a system and checks that it can be fully constrained, without 
+    solving it or loading the Rust library. Returns the preprocessed system, or 
+    raises `NexsysStructureError` describing the unmatched equations and variables.
+    """
+    table = SymbolTable()
+    system, origins = _run_preprocessors(system, preprocessors, table.known_values(), table.declared_variables())
+
+    check_structure([_Equation(line, table, n) for line, n in zip(system.split("\n"), origins) if "=" in line], table)
+    return system
+
+def _is_block_open(line: str):
+    """
+    Whether a line (with comments removed) opens a multiline "if statement".
+    """
+    return line.lstrip().startswith("if") and "[" in line
+
+def _is_block_close(line: str):
+    """
+    Whether a line (with comments removed) closes a multiline "if statement".
+    """
+    return line.rstrip().endswith("end")
+
+def nexsys2_stream(lines: any, preprocessors: list = [], batch_size: int = 256):
+    """
+    Solves a system of equations read incrementally from an iterable of lines, 
+    yielding a `dict` of newly solved values after each batch of lines. 
+
+    Lines are preprocessed in batches of roughly `batch_size` statements, never 
+    splitting a multiline "if statement". Equations are solved as soon as they 
+    become determined, so only unsolved equations and known values are kept in
+    memory. Directives only affect equations solved after they are read.
+    """
+    table = SymbolTable()
+    ctx_dict = table.known_values()
+    declared_dict = table.declared_variables()
+    ctx_pool = ContextPool()
+    equations = []
+
+    batch = []
+    batch_start = [0] # Lines read before the current batch
+    open_blocks = 0
+    token = ctx_dict.change_token()
+
+    def solve_batch():
+        system = "\n".join(batch)
+        first_line = batch_start[0]
+        batch_start[0] += len(batch)
+        batch.clear()
+
+        system, origins = _run_preprocessors(system, preprocessors, ctx_dict, declared_dict)
+
+        equations.extend(
+            _Equation(line, table, None if n is None else first_line + n) 
+            for line, n in zip(system.split("\n"), origins) if "=" in line
+        )
+        _solve_pool(equations, table, ctx_pool)
+
+    for line in lines:
+        line = line.rstrip("\r\n")
+        batch.append(line)
+
+        code = line.split("//", 1)[0]
+        if _is_block_open(code):
+            open_blocks += 1
+        if open_blocks and _is_block_close(code):
+            open_blocks -= 1
+
+        if open_blocks == 0 and len(batch) >= batch_size:
+            solve_batch()
+            solved = ctx_dict.changes_since(token)
+            token = ctx_dict.change_token()
+            if solved:
+                yield solved
+
+    if batch:
+        solve_batch()
+        solved = ctx_dict.changes_since(token)
+        if solved:
+            yield solved
+
+    ctx_pool.clear()
+
+    if len(equations) != 0:
+        raise Exception
+
+def read_system_lines(source: any, use_mmap: bool = False):
+    """
+    Yields the lines of a system incrementally from a file path, an open text 
+    file, or `"-"` for standard input. If `use_mmap` is set, a file path is 
+    memory-mapped instead of read through a buffer.
+    """
+    if source == "-":
+        yield from stdin
+
+    elif type(source) != str:
+        yield from source
+
+    elif use_mmap and path.getsize(source) > 0:
+        from mmap import mmap, ACCESS_READ
+
+        with open(source, "rb") as f, mmap(f.fileno(), 0, access = ACCESS_READ) as mm:
+            for line in iter(mm.readline, b""):
+                yield line.decode("utf-8")
+
+    else:
+        with open(source, "r", encoding = "utf-8") as f:
+            yield from f
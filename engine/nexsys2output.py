@@ -0,0 +1,143 @@
+"""
+Provides writers for emitting Nexsys2 solutions in machine-readable formats.
+
+Each writer accepts solutions one block at a time (a whole file, or a batch
+of values from the streaming solver) and writes each block with a single
+bulk write to a binary stream.
+
+### Formats
+- `repr`: the Python `dict` repr of each block, as printed by Nexsys2 by default.
+- `jsonl`: one JSON object per block: `{"source": ..., "values": {name: value, ...}}`
+- `csv`: a `source,name,value` header followed by one row per variable.
+- `bin`: one record per block, all integers little-endian:
+```
+b"NXS2" | u32 source length | source (utf-8) | u32 count n
+        | n float64 values  | n x (u32 name length | name (utf-8))
+```
+"""
+from abc import ABC, abstractmethod
+from array import array
+from csv import writer as csv_writer
+from fnmatch import fnmatchcase
+from io import StringIO
+from json import dumps
+from struct import pack
+from sys import byteorder
+
+BINARY_MAGIC = b"NXS2"
+"""
+Marker at the start of every block in the `bin` format.
+"""
+
+def select_variables(solution: any, include: list = None, order: str = "solved"):
+    """
+    Returns the `(name, value)` pairs of a solution to be written. If `include`
+    is given, only names matching at least one of its glob patterns are kept.
+    `order` is either `"solved"` (the solution's own order) or `"name"`.
+    """
+    items = solution.items()
+
+    if include:
+        items = [(k, v) for k, v in items if any(fnmatchcase(k, pat) for pat in include)]
+
+    if order == "name":
+        return sorted(items)
+
+    return list(items)
+
+class ResultWriter(ABC):
+    """
+    Base class for solution writers. Subclasses implement `format_block`,
+    returning the encoded bytes for one block.
+    """
+
+    def __init__(self, stream: any, include: list = None, order: str = "solved"):
+        """
+        Creates a writer for the binary `stream`, keeping only variables that
+        match `include` and writing them in the given `order`.
+        """
+        self.stream  = stream
+        self.include = include
+        self.order   = order
+
+    def write_block(self, solution: any, source: str = ""):
+        """
+        Writes one block of a solution, labelled with its `source`.
+        """
+        self.stream.write(self.format_block(select_variables(solution, self.include, self.order), source))
+
+    @abstractmethod
+    def format_block(self, items: list, source: str) -> bytes:
+        """
+        Encodes one block's selected `(name, value)` items, labelled with 
+        its `source`, as bytes.
+        """
+
+    def flush(self):
+        self.stream.flush()
+
+class ReprWriter(ResultWriter):
+    """
+    Writes each block as a Python `dict` repr.
+    """
+
+    def format_block(self, items: list, source: str) -> bytes:
+        return (repr(dict(items)) + "\n").encode("utf-8")
+
+class JsonLinesWriter(ResultWriter):
+    """
+    Writes each block as a single line of JSON.
+    """
+
+    def format_block(self, items: list, source: str) -> bytes:
+        return (dumps({"source": source, "values": dict(items)}) + "\n").encode("utf-8")
+
+class CsvWriter(ResultWriter):
+    """
+    Writes one CSV row per variable, with a header before the first block.
+    """
+
+    def __init__(self, stream: any, include: list = None, order: str = "solved"):
+        super().__init__(stream, include, order)
+        self.wrote_header = False
+
+    def format_block(self, items: list, source: str) -> bytes:
+        buf = StringIO()
+        rows = csv_writer(buf, lineterminator = "\n")
+
+        if not self.wrote_header:
+            rows.writerow(("source", "name", "value"))
+            self.wrote_header = True
+
+        rows.writerows((source, k, repr(v)) for k, v in items)
+        return buf.getvalue().encode("utf-8")
+
+class BinaryWriter(ResultWriter):
+    """
+    Writes each block as packed float64 values followed by a name table.
+    """
+
+    def format_block(self, items: list, source: str) -> bytes:
+        c_source = source.encode("utf-8")
+
+        values = array("d", (v for _, v in items))
+        if byteorder != "little":
+            values.byteswap()
+
+        parts = [BINARY_MAGIC, pack("<I", len(c_source)), c_source, pack("<I", len(items)), values.tobytes()]
+        for name, _ in items:
+            c_name = name.encode("utf-8")
+            parts.append(pack("<I", len(c_name)))
+            parts.append(c_name)
+
+        return b"".join(parts)
+
+WRITERS = {
+    "repr":  ReprWriter,
+    "jsonl": JsonLinesWriter,
+    "csv":   CsvWriter,
+    "bin":   BinaryWriter,
+}
+"""
+Solution writers by format name.
+"""
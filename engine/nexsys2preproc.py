@@ -2,9 +2,13 @@
 Defines built-in preprocessors for adding
 syntactic sugar to Nexsys2.
 """
+from ast import parse, walk, Add, BinOp, Constant, Expression, FloorDiv, Load, Mod, Mult, Name, Sub, UAdd, UnaryOp, USub
 from copy import copy
-from engine.nexsys2lib import DeclaredVariable, nexsys_findall
+from itertools import product
+from re import compile as compile_regex, IGNORECASE, MULTILINE
+from engine.nexsys2lib import DeclaredVariable, indexed_name, nexsys_findall, preprocessor
 
+@preprocessor(triggers = ("//",), line_local = True)
 def comments(system: str, ctx_dict: dict, declared_dict: dict):
     """
     Removes comments from code prior to processing anything else.
@@ -21,9 +25,131 @@ def comments(system: str, ctx_dict: dict, declared_dict: dict):
 
     return system
 
+_INDEXED_REF = compile_regex(r"([a-z][a-z0-9_]*)\[([^\[\]]*)\]", IGNORECASE)
+_FOR_HEADER = compile_regex(r"^[ \t]*for .*:", MULTILINE)
+_LOOP_RANGE = compile_regex(r"\s*([a-z][a-z0-9_]*)\s+in\s+(-?[0-9]+)\s*\.\.\s*(-?[0-9]+)\s*", IGNORECASE)
+_MANGLED_NAME = compile_regex(r"(?<![A-Za-z0-9_])[a-z][a-z0-9_]*__m?[0-9]+(?![A-Za-z0-9_\[])", IGNORECASE)
+_INDEX_NODES = (Expression, BinOp, UnaryOp, Name, Load, Constant, Add, Sub, Mult, FloorDiv, Mod, UAdd, USub)
+
+def _compile_index(expr: str, loop_vars: tuple):
+    """
+    Compiles an integer index expression over `loop_vars` into 
+    a function taking the loop variables' values.
+    """
+    try:
+        tree = parse(expr.strip(), mode = "eval")
+    except SyntaxError:
+        raise ValueError(f"invalid index expression: [{expr}]")
+
+    for node in walk(tree):
+        if not isinstance(node, _INDEX_NODES)                                   \
+            or (isinstance(node, Name) and node.id not in loop_vars)            \
+            or (isinstance(node, Constant) and type(node.value) != int):
+            raise ValueError(f"invalid index expression: [{expr}]")
+
+    return eval(f"lambda {', '.join(loop_vars)}: ({expr.strip()})", {"__builtins__": {}})
+
+def _compile_template(statement: str, loop_vars: tuple):
+    """
+    Splits a statement into literal text and functions of the loop 
+    variables' values that produce the text varying between iterations.
+    """
+    loop_var_pattern = None
+    if loop_vars:
+        loop_var_pattern = compile_regex(r"(?<![A-Za-z0-9_])(" + "|".join(loop_vars) + r")(?![A-Za-z0-9_\[])")
+
+    def literal_parts(text: str):
+        if not loop_var_pattern:
+            return [text]
+
+        parts, pos = [], 0
+        for m in loop_var_pattern.finditer(text):
+            k = loop_vars.index(m.group(1))
+            parts.append(text[pos:m.start()])
+            parts.append(lambda *vals, k = k: str(vals[k]) if vals[k] >= 0 else f"({vals[k]})")
+            pos = m.end()
+        parts.append(text[pos:])
+        return parts
+
+    parts, pos = [], 0
+    for m in _INDEXED_REF.finditer(statement):
+        base, expr = m.groups()
+        if base.lower() == "if":
+            continue
+
+        index = _compile_index(expr, loop_vars)
+        parts.extend(literal_parts(statement[pos:m.start()]))
+        parts.append(lambda *vals, base = base, index = index: indexed_name(base, index(*vals)))
+        pos = m.end()
+    parts.extend(literal_parts(statement[pos:]))
+
+    return [p for p in parts if p != ""]
+
+def _expand_template(parts: list, vals: tuple):
+    return "".join([p if type(p) == str else p(*vals) for p in parts])
+
+@preprocessor(after = ("comments",), triggers = ("[", "for "), line_map = True)
+def indexed_variables(system: str, ctx_dict: dict, declared_dict: dict):
+    """
+    Expands ranged statements and renames indexed variables. Ranges are 
+    inclusive, may be combined with commas, and apply to equations as 
+    well as to `guess` and `keep` directives. Each statement is compiled 
+    once and expanded in index order, so banded structure is preserved 
+    in the equation order. `t[3]` is renamed to `t__3` internally, so 
+    identifiers already of that form are rejected. Also returns the input 
+    line each output line was expanded from.
+
+    ### Example: expands to 500 equations, guesses and domains
+    ```
+    for i in 1..500: t[i+1] = t[i] + q[i]/c
+    for i in 1..501: guess 300 for t[i]
+    for i in 1..500, j in 1..2: keep q[2*i+j] on [0, 1000]
+    ```
+    """
+    # `keep` and `guess` directives also trigger this stage, so look for indexed syntax first
+    if not _FOR_HEADER.search(system) and all(m.group(1).lower() == "if" for m in _INDEXED_REF.finditer(system)):
+        return system, list(range(system.count("\n") + 1))
+
+    clash = _MANGLED_NAME.search(system)
+    if clash:
+        raise ValueError(f"'{clash.group(0)}' clashes with the internal name of an indexed variable")
+
+    expanded, origins = [], []
+    for n, line in enumerate(system.split("\n")):
+        stripped = line.lstrip()
+
+        if stripped.startswith("for ") and ":" in stripped:
+            header, statement = stripped[4:].split(":", 1)
+
+            loop_vars, ranges = [], []
+            for loop_range in header.split(","):
+                m = _LOOP_RANGE.fullmatch(loop_range)
+                if not m:
+                    raise ValueError(f"invalid loop range: {loop_range.strip()}")
+
+                var, start, stop = m.group(1), int(m.group(2)), int(m.group(3))
+                step = 1 if stop >= start else -1
+                loop_vars.append(var)
+                ranges.append(range(start, stop + step, step))
+
+            parts = _compile_template(statement.strip(), tuple(loop_vars))
+            expanded.extend(_expand_template(parts, vals) for vals in product(*ranges))
+
+        elif "[" in line:
+            expanded.append(_expand_template(_compile_template(line, ()), ()))
+
+        else:
+            expanded.append(line)
+
+        origins.extend([n] * (len(expanded) - len(origins)))
+
+    return "\n".join(expanded), origins
+
+@preprocessor(after = ("comments", "indexed_variables"), triggers = ("if",), line_map = True)
 def conditionals(system: str, ctx_dict: dict, declared_dict: dict):
     """
-    Reformats multiline "if statements" to "if" function calls
+    Reformats multiline "if statements" to "if" function calls, also returning 
+    the input line each output line starts on.
 
     ### Example: if(i,4.0,0,-i,i) = 0 
     ```
@@ -45,6 +171,19 @@ def conditionals(system: str, ctx_dict: dict, declared_dict: dict):
                 "[" in line or 
                 "]" in line)
 
+    def replace_all(system: str, original: str, formatted: str):
+        # Replaces like `str.replace`, merging the origins of joined lines
+        pos = system.find(original)
+        while pos != -1:
+            line = system.count("\n", 0, pos)
+            del origins[line + 1 : line + 1 + original.count("\n") - formatted.count("\n")]
+            system = system[:pos] + formatted + system[pos + len(original):]
+            pos = system.find(original, pos + len(formatted))
+
+        return system
+
+    origins = list(range(system.count("\n") + 1))
+
     # pattern = r"if *\[.*([<>=]{2}).*\].* +else +.* +end"
     pattern = r"if ?\[ ?.* ?([<>=]{1,2}) ?.* ?\] ?.* ?else ?.*"
     while True:
@@ -76,11 +215,12 @@ def conditionals(system: str, ctx_dict: dict, declared_dict: dict):
                 .replace("else",    ",")            \
                 .replace("end",     ") = 0")
 
-            system = system.replace(original, formatted)
+            system = replace_all(system, original, formatted)
 
         if raw_system == system: # only quit when all ifs have been compiled
-            return system
+            return system, origins
 
+@preprocessor(after = ("comments", "indexed_variables"), triggers = ("const",), line_local = True)
 def const_values(system: str, ctx_dict: dict, declared_dict: dict):
     """
     Adds custom constants to the ctx dict.
@@ -97,6 +237,7 @@ def const_values(system: str, ctx_dict: dict, declared_dict: dict):
 
     return system
 
+@preprocessor(after = ("comments", "indexed_variables"), triggers = ("keep",), line_local = True)
 def domains(system: str, ctx_dict: dict, declared_dict: dict):
     """
     Adds domain specifications to the declared dict.
@@ -117,6 +258,7 @@ def domains(system: str, ctx_dict: dict, declared_dict: dict):
 
     return system
 
+@preprocessor(after = ("comments", "indexed_variables"), triggers = ("guess",), line_local = True)
 def guess_values(system: str, ctx_dict: dict, declared_dict: dict):
     """
     Adds guess values to the declared dict.
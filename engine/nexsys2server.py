@@ -0,0 +1,246 @@
+"""
+Provides a long-running Nexsys2 solve server and a thin client for it.
+
+Keeping one process alive avoids paying interpreter startup, the Rust
+library load and ctypes setup on every solve. Clients talk to the server
+over a Unix socket or a localhost TCP socket using newline-delimited JSON.
+The server does not authenticate clients, so TCP addresses are restricted
+to loopback hosts.
+
+### Protocol
+Each request is one line of JSON:
+```
+{"batch": [{"id": "pipe.nxs", "system": "x = 2 * y\\n y = 3"}, ...]}
+```
+Each response is one line of JSON with a result per batch item, in order:
+```
+{"results": [{"id": "pipe.nxs", "solution": {"y": 3.0, "x": 6.0}, "error": null, "latency": 0.0012}], "latency": 0.0013}
+```
+Latencies are wall-clock seconds measured by the server.
+"""
+from collections import OrderedDict
+from hashlib import blake2b
+from ipaddress import ip_address
+from json import dumps, loads
+from os import path, stat, unlink
+from socket import AF_INET, AF_UNIX, SOCK_STREAM, socket
+from socketserver import StreamRequestHandler, ThreadingMixIn, TCPServer, UnixStreamServer
+from stat import S_ISSOCK
+from threading import Lock
+from time import perf_counter
+from engine.nexsys2lib import nexsys2
+
+DEFAULT_ADDRESS = "127.0.0.1:7484"
+"""
+Address used by the server and client when none is given.
+"""
+
+DEFAULT_CACHE_SIZE = 1024
+"""
+Number of solved systems kept in the server's solution cache.
+"""
+
+def parse_address(address: str):
+    """
+    Splits an address string into a socket family and a bindable address.
+    Addresses of the form `"unix:/path/to/socket"` use a Unix socket, while
+    `"host:port"` addresses use TCP and must name a loopback host.
+    """
+    if address.startswith("unix:"):
+        return AF_UNIX, address[len("unix:"):]
+
+    host, _, port = address.rpartition(":")
+    host = host or "127.0.0.1"
+    if host != "localhost":
+        try:
+            is_loopback = ip_address(host).is_loopback
+        except ValueError:
+            is_loopback = False
+
+        if not is_loopback:
+            raise ValueError(f"{host} is not a loopback host")
+
+    return AF_INET, (host, int(port))
+
+def _remove_stale_socket(socket_path: str):
+    """
+    Removes a leftover Unix socket at `socket_path`, refusing to remove
+    anything that is not a socket.
+    """
+    if not path.exists(socket_path):
+        return
+
+    if not S_ISSOCK(stat(socket_path).st_mode):
+        raise FileExistsError(f"{socket_path} exists and is not a socket")
+
+    unlink(socket_path)
+
+class SolutionCache:
+    """
+    A thread-safe LRU cache mapping system text to its solution.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    @staticmethod
+    def key(system: str):
+        """
+        Returns the cache key for the given system text.
+        """
+        return blake2b(system.encode("utf-8"), digest_size = 16).digest()
+
+    def get(self, system: str):
+        """
+        Returns a copy of the cached solution for `system`, or `None`.
+        """
+        key = SolutionCache.key(system)
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return dict(self.entries[key])
+
+    def put(self, system: str, solution: dict):
+        """
+        Stores a copy of `solution`, evicting the least recently used entry
+        if the cache is full.
+        """
+        key = SolutionCache.key(system)
+        with self.lock:
+            self.entries[key] = dict(solution)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last = False)
+
+class NexsysServerHandler(StreamRequestHandler):
+    """
+    Handles a client connection, answering one response line
+    per request line until the client disconnects.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+
+            start = perf_counter()
+            try:
+                batch = loads(line)["batch"]
+                results = [self.server.solve_item(item) for item in batch]
+                response = {"results": results}
+            except (ValueError, KeyError, TypeError) as e:
+                response = {"results": [], "error": f"malformed request: {e}"}
+
+            response["latency"] = perf_counter() - start
+            self.wfile.write(dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+class _NexsysServerMixIn:
+    """
+    Solving state shared by the TCP and Unix socket servers. Listed before
+    `ThreadingMixIn` so that idle connections do not block shutdown.
+    """
+
+    daemon_threads = True
+    block_on_close = False
+
+    def setup_solver(self, preprocessors: list, cache_size: int):
+        self.preprocessors = preprocessors
+        self.cache = SolutionCache(cache_size)
+
+    def solve_item(self, item: dict):
+        """
+        Solves a single batch item, returning its result record.
+        """
+        start = perf_counter()
+        if not isinstance(item, dict):
+            return {"id": None, "solution": None, "error": "batch item must be an object", "latency": perf_counter() - start}
+
+        system = item.get("system")
+        result = {"id": item.get("id"), "solution": None, "error": None}
+
+        if not isinstance(system, str):
+            result["error"] = "batch item 'system' must be a string"
+            result["latency"] = perf_counter() - start
+            return result
+
+        solution = self.cache.get(system)
+        if solution is None:
+            try:
+                solution = dict(nexsys2(system, self.preprocessors))
+                self.cache.put(system, solution)
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+
+        result["solution"] = solution
+        result["latency"] = perf_counter() - start
+        return result
+
+class NexsysTCPServer(_NexsysServerMixIn, ThreadingMixIn, TCPServer):
+    allow_reuse_address = True
+
+class NexsysUnixServer(_NexsysServerMixIn, ThreadingMixIn, UnixStreamServer):
+    pass
+
+def serve(address: str, preprocessors: list, cache_size: int = DEFAULT_CACHE_SIZE):
+    """
+    Runs a Nexsys2 solve server on `address` until interrupted.
+    """
+    family, bind_address = parse_address(address)
+
+    if family == AF_UNIX:
+        _remove_stale_socket(bind_address)
+        server = NexsysUnixServer(bind_address, NexsysServerHandler)
+    else:
+        server = NexsysTCPServer(bind_address, NexsysServerHandler)
+
+    server.setup_solver(preprocessors, cache_size)
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if family == AF_UNIX:
+                _remove_stale_socket(bind_address)
+
+class NexsysClient:
+    """
+    A thin client that forwards systems to a running Nexsys2 server.
+    """
+
+    def __init__(self, address: str = DEFAULT_ADDRESS):
+        family, connect_address = parse_address(address)
+        self.sock = socket(family, SOCK_STREAM)
+        self.sock.connect(connect_address)
+        self.rfile = self.sock.makefile("rb")
+        self.wfile = self.sock.makefile("wb")
+
+    def solve_batch(self, items: list):
+        """
+        Sends a batch of `(id, system)` pairs to the server,
+        returning the decoded response.
+        """
+        request = {"batch": [{"id": i, "system": s} for i, s in items]}
+        self.wfile.write(dumps(request).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+        line = self.rfile.readline()
+        if not line:
+            raise ConnectionError("server closed the connection")
+
+        return loads(line)
+
+    def close(self):
+        self.rfile.close()
+        self.wfile.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
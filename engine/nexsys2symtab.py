@@ -0,0 +1,271 @@
+"""
+Provides a compact, array-backed store for the state of every
+variable in a Nexsys2 system, along with `dict`-like views of it.
+"""
+from array import array
+from collections.abc import MutableMapping
+
+_INF = float("inf")
+
+class DeclaredVariable:
+    """
+    A guess value and domain declared for a variable.
+    """
+
+    __slots__ = ("guess", "min_val", "max_val")
+
+    def __init__(self, guess: float = 1.0, min_val: float = -_INF, max_val: float = _INF):
+        self.guess   = guess
+        self.min_val = min_val
+        self.max_val = max_val
+
+    def __eq__(self, other):
+        return (self.guess, self.min_val, self.max_val) == (other.guess, other.min_val, other.max_val)
+
+    def __repr__(self):
+        return f"DeclaredVariable(guess={self.guess}, min_val={self.min_val}, max_val={self.max_val})"
+
+class SymbolTable:
+    """
+    Interns variable names to integer ids and stores each variable's value,
+    guess and domain in contiguous arrays indexed by id. Names are encoded
+    for the FFI once, when they are interned.
+
+    If `blocks` is a list, each solved block of equations is appended to it
+    in solve order as an `(equations, unknown ids, known ids)` triple of tuples.
+    """
+
+    __slots__ = (
+        "ids", "names", "encoded",
+        "values", "known", "guesses", "min_vals", "max_vals", "declared",
+        "change_log", "generation", "blocks"
+    )
+
+    def __init__(self):
+        self.ids        = {}
+        self.names      = []
+        self.encoded    = []
+        self.values     = array("d")
+        self.known      = bytearray()
+        self.guesses    = array("d")
+        self.min_vals   = array("d")
+        self.max_vals   = array("d")
+        self.declared   = bytearray()
+        self.change_log = array("q")
+        self.generation = 0
+        self.blocks     = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, name: str) -> int:
+        """
+        Returns the id of `name`, adding it to the table if it is new.
+        """
+        vid = self.ids.get(name)
+        if vid is not None:
+            return vid
+
+        vid = len(self.names)
+        self.ids[name] = vid
+        self.names.append(name)
+        self.encoded.append(bytes(name, "utf-8"))
+        self.values.append(0.0)
+        self.known.append(0)
+        self.guesses.append(1.0)
+        self.min_vals.append(-_INF)
+        self.max_vals.append(_INF)
+        self.declared.append(0)
+        return vid
+
+    def set_value(self, vid: int, val: float):
+        """
+        Marks the variable with id `vid` as known with the value `val`.
+        """
+        self.values[vid] = val
+        self.known[vid] = 1
+        self.change_log.append(vid)
+
+    def forget_value(self, vid: int):
+        """
+        Marks the variable with id `vid` as unknown again.
+        """
+        self.known[vid] = 0
+        self.generation += 1
+        self.change_log = array("q", (v for v in self.change_log if v != vid))
+
+    def record_block(self, equations: list, unknowns: tuple):
+        """
+        Records that `equations` (each with a `text` and the `var_ids` it references) 
+        were solved for the variables with ids `unknowns`, if blocks are being recorded.
+        """
+        if self.blocks is not None:
+            knowns = { vid for x in equations for vid in x.var_ids }.difference(unknowns)
+            self.blocks.append((tuple(x.text for x in equations), unknowns, tuple(sorted(knowns))))
+
+    def declare(self, vid: int, guess: float, min_val: float, max_val: float):
+        """
+        Sets the guess value and domain of the variable with id `vid`.
+        """
+        self.guesses[vid]  = guess
+        self.min_vals[vid] = min_val
+        self.max_vals[vid] = max_val
+        self.declared[vid] = 1
+
+    def known_values(self):
+        """
+        Returns a `dict`-like view of the known values in the table.
+        """
+        return KnownValues(self)
+
+    def declared_variables(self):
+        """
+        Returns a `dict`-like view of the declared variables in the table.
+        """
+        return DeclaredVariables(self)
+
+class KnownValues(MutableMapping):
+    """
+    A `dict`-like view mapping the names of known variables to their values,
+    in the order they became known.
+    """
+
+    __slots__ = ("table",)
+
+    def __init__(self, table: SymbolTable):
+        self.table = table
+
+    def __getitem__(self, name: str) -> float:
+        vid = self.table.ids.get(name)
+        if vid is None or not self.table.known[vid]:
+            raise KeyError(name)
+        return self.table.values[vid]
+
+    def __setitem__(self, name: str, val: float):
+        vid = self.table.intern(name)
+        if not (self.table.known[vid] and self.table.values[vid] == val):
+            self.table.set_value(vid, val)
+
+    def __delitem__(self, name: str):
+        vid = self.table.ids.get(name)
+        if vid is None or not self.table.known[vid]:
+            raise KeyError(name)
+        self.table.forget_value(vid)
+
+    def __contains__(self, name) -> bool:
+        vid = self.table.ids.get(name)
+        return vid is not None and self.table.known[vid] == 1
+
+    def __iter__(self):
+        names = self.table.names
+        seen = set()
+        for vid in self.table.change_log:
+            if vid not in seen:
+                seen.add(vid)
+                yield names[vid]
+
+    def __len__(self):
+        return self.table.known.count(1)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def change_token(self):
+        """
+        Returns an opaque token marking the current state of the view.
+        """
+        return (self.table, self.table.generation, len(self.table.change_log))
+
+    def changes_since(self, token):
+        """
+        Returns a `dict` of the values set since `token` was taken, or
+        `None` if the changes cannot be determined from the token.
+        """
+        table, generation, pos = token
+        if table is not self.table or generation != self.table.generation:
+            return None
+
+        names, values = self.table.names, self.table.values
+        return { names[vid] : values[vid] for vid in self.table.change_log[pos:] }
+
+class DeclaredVariableView:
+    """
+    A `DeclaredVariable` whose fields read from and write to a `SymbolTable`.
+    """
+
+    __slots__ = ("table", "vid")
+
+    def __init__(self, table: SymbolTable, vid: int):
+        self.table = table
+        self.vid   = vid
+
+    @property
+    def guess(self) -> float:
+        return self.table.guesses[self.vid]
+
+    @guess.setter
+    def guess(self, val: float):
+        self.table.guesses[self.vid] = val
+
+    @property
+    def min_val(self) -> float:
+        return self.table.min_vals[self.vid]
+
+    @min_val.setter
+    def min_val(self, val: float):
+        self.table.min_vals[self.vid] = val
+
+    @property
+    def max_val(self) -> float:
+        return self.table.max_vals[self.vid]
+
+    @max_val.setter
+    def max_val(self, val: float):
+        self.table.max_vals[self.vid] = val
+
+    def __eq__(self, other):
+        return (self.guess, self.min_val, self.max_val) == (other.guess, other.min_val, other.max_val)
+
+    def __repr__(self):
+        return f"DeclaredVariable(guess={self.guess}, min_val={self.min_val}, max_val={self.max_val})"
+
+class DeclaredVariables(MutableMapping):
+    """
+    A `dict`-like view mapping the names of declared variables to
+    their guess values and domains.
+    """
+
+    __slots__ = ("table",)
+
+    def __init__(self, table: SymbolTable):
+        self.table = table
+
+    def __getitem__(self, name: str) -> DeclaredVariableView:
+        vid = self.table.ids.get(name)
+        if vid is None or not self.table.declared[vid]:
+            raise KeyError(name)
+        return DeclaredVariableView(self.table, vid)
+
+    def __setitem__(self, name: str, var: DeclaredVariable):
+        self.table.declare(self.table.intern(name), var.guess, var.min_val, var.max_val)
+
+    def __delitem__(self, name: str):
+        vid = self.table.ids.get(name)
+        if vid is None or not self.table.declared[vid]:
+            raise KeyError(name)
+        self.table.declare(vid, 1.0, -_INF, _INF)
+        self.table.declared[vid] = 0
+
+    def __contains__(self, name) -> bool:
+        vid = self.table.ids.get(name)
+        return vid is not None and self.table.declared[vid] == 1
+
+    def __iter__(self):
+        names = self.table.names
+        return (names[vid] for vid, flag in enumerate(self.table.declared) if flag)
+
+    def __len__(self):
+        return self.table.declared.count(1)
+
+    def __repr__(self):
+        return repr(dict(self))
@@ -0,0 +1,239 @@
+"""
+Provides recording and replay of Nexsys2 solve traces for performance
+regression testing.
+
+A trace records every numeric solve attempt made by `nexsys2`, in order:
+the equations and unknowns involved, the known values they reference, the
+guesses and domains used, the solver method, iteration count (where the
+solver reports one), wall-clock time and outcome. Traces are stored as
+gzip-compressed JSON lines.
+
+Replaying a trace re-executes each step in isolation against the current
+engine and compares timings, iteration counts and outcomes step by step:
+```
+python -m engine.nexsys2trace replay model.trace.gz --tolerance 1.5 --repeats 5
+```
+Both sides time the same window: the call to `solve_equation` for single
+equations, building and solving the `System` for Rust blocks, and
+`newton_solve` for sparse blocks. Replay warms each step up before timing
+it and keeps the best of several runs.
+The command exits with status 1 if any step regressed, so captured
+production workloads can be checked in CI.
+"""
+from argparse import ArgumentParser
+from gzip import open as gzip_open
+from json import dumps, loads
+from sys import argv, exit
+from time import perf_counter
+from engine.geqslib import create_context_with, solve_equation, SystemBuilder, WILL_CONSTRAIN
+from engine.nexsys2jacobian import compile_block, newton_solve
+
+TRACE_FORMAT = "nexsys2-trace"
+TRACE_VERSION = 1
+
+class SolveTrace:
+    """
+    An in-memory record of the solve steps taken by `nexsys2`.
+    """
+
+    def __init__(self, source: str = ""):
+        """
+        Creates an empty trace. Steps are labelled with `source`,
+        which may be changed between solves.
+        """
+        self.source = source
+        self.steps = []
+
+    def record(self,
+        kind: str,
+        method: str,
+        equations: list,
+        unknowns: list,
+        knowns: dict,
+        guesses: list,
+        mins: list,
+        maxes: list,
+        solved: bool,
+        iterations: int,
+        seconds: float,
+        declared: list = None
+    ):
+        """
+        Appends a solve step to the trace. `kind` is `"single"` or `"block"`
+        and `method` is `"rust"` or `"sparse"`. `iterations` is `None` when
+        the solver does not report it. `declared` flags the unknowns whose 
+        guesses and domains were specified to the solver (by default, all).
+        """
+        self.steps.append({
+            "source":     self.source,
+            "kind":       kind,
+            "method":     method,
+            "equations":  equations,
+            "unknowns":   unknowns,
+            "knowns":     knowns,
+            "guesses":    guesses,
+            "mins":       mins,
+            "maxes":      maxes,
+            "declared":   declared,
+            "solved":     solved,
+            "iterations": iterations,
+            "seconds":    seconds,
+        })
+
+    def save(self, trace_path: str):
+        """
+        Writes the trace to a gzip-compressed JSON lines file.
+        """
+        lines = [dumps({ "format" : TRACE_FORMAT, "version" : TRACE_VERSION })]
+        lines.extend(dumps(step, separators = (",", ":")) for step in self.steps)
+
+        with gzip_open(trace_path, "wt", encoding = "utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    @classmethod
+    def load(cls, trace_path: str):
+        """
+        Reads a trace written by `save`.
+        """
+        trace = cls()
+        with gzip_open(trace_path, "rt", encoding = "utf-8") as f:
+            header = loads(f.readline())
+            if header.get("format") != TRACE_FORMAT or header.get("version") != TRACE_VERSION:
+                raise ValueError(f"{trace_path} is not a version {TRACE_VERSION} Nexsys2 trace")
+
+            trace.steps = [loads(line) for line in f if line.strip()]
+
+        return trace
+
+def _replay_single(step: dict):
+    with create_context_with(step["knowns"]) as ctx:
+        start = perf_counter()
+        maybe_soln = solve_equation(step["equations"][0],
+            ctx = ctx,
+            guess = step["guesses"][0],
+            soln_min = step["mins"][0],
+            soln_max = step["maxes"][0])
+        seconds = perf_counter() - start
+
+    return maybe_soln is not None, None, seconds
+
+def _replay_rust_block(step: dict):
+    with create_context_with(step["knowns"]) as ctx, SystemBuilder(step["equations"][0], ctx) as builder:
+        for eqn in step["equations"][1:]:
+            if WILL_CONSTRAIN != builder.try_constrain_with(eqn):
+                return False, None, 0.0
+
+        declared = step.get("declared") or [True] * len(step["unknowns"])
+
+        start = perf_counter()
+        system = builder.build_system()
+        if system is None:
+            return False, None, perf_counter() - start
+
+        for var, guess, min_val, max_val, is_declared in zip(step["unknowns"], step["guesses"], step["mins"], step["maxes"], declared):
+            if is_declared:
+                system.specify_variable(var, guess = guess, min = min_val, max = max_val)
+
+        solved = system.solve_system() is not None
+        return solved, None, perf_counter() - start
+
+def _replay_sparse_block(step: dict):
+    compiled = compile_block(tuple(step["equations"]), tuple(step["unknowns"]))
+    if compiled is None:
+        return False, None, 0.0
+
+    k = [step["knowns"][name] for name in compiled.knowns]
+
+    start = perf_counter()
+    try:
+        maybe_soln = newton_solve(compiled, k, step["guesses"], step["mins"], step["maxes"])
+    except Exception:
+        maybe_soln = None
+    seconds = perf_counter() - start
+
+    if maybe_soln is None:
+        return False, None, seconds
+
+    return True, maybe_soln[1], seconds
+
+def replay_step(step: dict):
+    """
+    Re-executes a single recorded step, returning whether it was solved,
+    the iteration count (or `None`) and the wall-clock time taken by the
+    same window that was timed when recording.
+    """
+    replay = _replay_single
+    if step["kind"] == "block":
+        replay = _replay_sparse_block if step["method"] == "sparse" else _replay_rust_block
+
+    return replay(step)
+
+def replay(trace: SolveTrace, tolerance: float = 1.5, min_seconds: float = 0.001, repeats: int = 5, warmup: int = 1):
+    """
+    Replays every step of a trace, returning one comparison record per step.
+    Each step is run `warmup` times untimed, then `repeats` times, keeping
+    the fastest. A step regresses if it no longer solves, takes more 
+    iterations, or takes more than `tolerance` times its recorded time 
+    (ignoring differences below `min_seconds`).
+    """
+    results = []
+    for n, step in enumerate(trace.steps):
+        for _ in range(warmup):
+            replay_step(step)
+
+        runs = [replay_step(step) for _ in range(max(repeats, 1))]
+        solved, iterations, _ = runs[0]
+        seconds = min(r[2] for r in runs)
+
+        regressed = (step["solved"] and not solved)                                                 \
+            or (None not in (step["iterations"], iterations) and iterations > step["iterations"])   \
+            or (seconds > step["seconds"] * tolerance and seconds - step["seconds"] > min_seconds)
+
+        results.append({
+            "step":                 n,
+            "source":               step["source"],
+            "kind":                 step["kind"],
+            "size":                 len(step["unknowns"]),
+            "solved":               (step["solved"], solved),
+            "iterations":           (step["iterations"], iterations),
+            "seconds":              (step["seconds"], seconds),
+            "regressed":            regressed,
+        })
+
+    return results
+
+def format_report(results: list):
+    """
+    Formats replay results as a table with one row per step.
+    """
+    rows = [f"{'step':>6} {'kind':>6} {'size':>6} {'solved':>11} {'iterations':>11} {'recorded':>11} {'replayed':>11}  source"]
+    for r in results:
+        solved = "/".join("y" if s else "n" for s in r["solved"])
+        iterations = "/".join("-" if i is None else str(i) for i in r["iterations"])
+        rows.append(
+            f"{r['step']:>6} {r['kind']:>6} {r['size']:>6} {solved:>11} {iterations:>11} "
+            f"{r['seconds'][0] * 1000:>9.3f}ms {r['seconds'][1] * 1000:>9.3f}ms  "
+            f"{r['source']}{'  REGRESSED' if r['regressed'] else ''}"
+        )
+
+    return "\n".join(rows)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "Replays Nexsys2 solve traces.")
+    commands = parser.add_subparsers(dest = "command", required = True)
+
+    replay_cmd = commands.add_parser("replay", help = "replay a trace and report regressions")
+    replay_cmd.add_argument("trace", help = "trace file written with nexsys2.py --trace")
+    replay_cmd.add_argument("--tolerance", type = float, default = 1.5,
+        help = "largest allowed ratio of replayed to recorded step time")
+    replay_cmd.add_argument("--min-seconds", type = float, default = 0.001,
+        help = "smallest slowdown of a step that counts as a regression")
+    replay_cmd.add_argument("--repeats", type = int, default = 5,
+        help = "timed runs per step, keeping the fastest")
+    replay_cmd.add_argument("--warmup", type = int, default = 1,
+        help = "untimed runs per step before timing")
+    opts = parser.parse_args(argv[1:])
+
+    results = replay(SolveTrace.load(opts.trace), opts.tolerance, opts.min_seconds, opts.repeats, opts.warmup)
+    print(format_report(results))
+    exit(1 if any(r["regressed"] for r in results) else 0)
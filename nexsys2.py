@@ -1,23 +1,166 @@
-from sys import argv
-from engine.nexsys2lib import nexsys2
+from argparse import ArgumentParser
+from sys import argv, exit, stderr, stdout
+from engine.nexsys2lib import nexsys2, nexsys2_check, nexsys2_preprocess, nexsys2_stream, read_system_lines, NexsysPreProcessorScheduler, NexsysStructureError
+from engine.nexsys2output import ReprWriter, WRITERS, ResultWriter
 import engine.nexsys2preproc as nexsys2preproc
 
-preprocs = [ # Preprocessor list - This can be extended as desired to add more syntax sugar
+preprocs = NexsysPreProcessorScheduler([ # Preprocessor list - This can be extended as desired to add more syntax sugar
     nexsys2preproc.comments,
+    nexsys2preproc.indexed_variables,
     nexsys2preproc.const_values,
     nexsys2preproc.domains,
     nexsys2preproc.guess_values,
-    nexsys2preproc.conditionals 
-]
+    nexsys2preproc.conditionals
+])
 
-def main(*args):
+def main(*args, writer: ResultWriter = None, trace_path: str = None):
     """
-    Default Nexsys2 solver. Takes a tuple of filepaths and returns a 
-    `Generator` containing their solutions, if they exist. 
+    Default Nexsys2 solver. Takes a tuple of filepaths and writes their 
+    solutions, if they exist, with `writer` (by default, a `dict` repr 
+    per file on standard output). If `trace_path` is given, a trace of 
+    every solve step is saved there for replay with `engine.nexsys2trace`.
     """
+    writer = writer or ReprWriter(stdout.buffer)
+
+    trace = None
+    if trace_path:
+        from engine.nexsys2trace import SolveTrace
+        trace = SolveTrace()
+
+    try:
+        for system_file in args:
+            if trace:
+                trace.source = system_file
+
+            with open(system_file, "r", encoding = "utf-8") as f:
+                writer.write_block(nexsys2(f.read(), preprocs, trace), system_file)
+        writer.flush()
+
+    finally:
+        if trace:
+            trace.save(trace_path)
+
+def stream(*args, use_mmap: bool = False, writer: ResultWriter = None):
+    """
+    Streaming Nexsys2 solver. Reads each filepath (or `"-"` for standard 
+    input) incrementally, writing each batch of values as soon as it is 
+    solved.
+    """
+    writer = writer or ReprWriter(stdout.buffer)
+
+    for system_file in args:
+        for solved in nexsys2_stream(read_system_lines(system_file, use_mmap), preprocs):
+            writer.write_block(solved, system_file)
+            writer.flush()
+
+def check(*args):
+    """
+    Preprocesses and validates each filepath without solving it, so the Rust 
+    libraries are never loaded. Returns whether every system is valid.
+    """
+    valid = True
+    for system_file in args:
+        with open(system_file, "r", encoding = "utf-8") as f:
+            try:
+                nexsys2_check(f.read(), preprocs)
+                print(f"{system_file}: ok", file = stderr)
+            except (NexsysStructureError, ValueError) as e:
+                print(f"{system_file}: {e}", file = stderr)
+                valid = False
+
+    return valid
+
+def preprocess(*args):
+    """
+    Writes each filepath's preprocessed system to standard output without 
+    validating or solving it. Returns whether every system was preprocessed.
+    """
+    valid = True
     for system_file in args:
         with open(system_file, "r", encoding = "utf-8") as f:
-            print(nexsys2(f.read(), preprocs))
+            try:
+                stdout.write(nexsys2_preprocess(f.read(), preprocs) + "\n")
+            except ValueError as e:
+                print(f"{system_file}: {e}", file = stderr)
+                valid = False
+
+    return valid
+
+def serve(address: str = None):
+    """
+    Runs a persistent Nexsys2 solve server on the given address (by default, 
+    `DEFAULT_ADDRESS`), keeping the solver library loaded and its caches warm 
+    between requests.
+    """
+    from engine.nexsys2server import DEFAULT_ADDRESS, serve
+    serve(address or DEFAULT_ADDRESS, preprocs)
+
+def client(address: str, *args, writer: ResultWriter = None):
+    """
+    Forwards the given filepaths to a running Nexsys2 server (by default, at 
+    `DEFAULT_ADDRESS`) as a single batch and writes their solutions, printing 
+    the server-side latency of each request.
+    """
+    from engine.nexsys2server import DEFAULT_ADDRESS, NexsysClient
+
+    address = address or DEFAULT_ADDRESS
+    writer = writer or ReprWriter(stdout.buffer)
+
+    items = []
+    for system_file in args:
+        with open(system_file, "r", encoding = "utf-8") as f:
+            items.append((system_file, f.read()))
+
+    with NexsysClient(address) as conn:
+        response = conn.solve_batch(items)
+
+    for result in response["results"]:
+        if result["error"] is not None:
+            print(f"{result['id']}: {result['error']}", file = stderr)
+        else:
+            writer.write_block(result["solution"], result["id"])
+        print(f"{result['id']}: {result['latency'] * 1000:.3f} ms", file = stderr)
+
+    writer.flush()
+    print(f"batch: {response['latency'] * 1000:.3f} ms", file = stderr)
 
 if __name__ == "__main__":
-    main(*(argv[1:]))
\ No newline at end of file
+    parser = ArgumentParser(description = "Solves Nexsys2 systems of equations.")
+    parser.add_argument("files", nargs = "*", help = "system files to solve")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--serve", nargs = "?", const = "", metavar = "ADDRESS",
+        help = "run a persistent solve server ('host:port' or 'unix:/path', by default 127.0.0.1:7484)")
+    mode.add_argument("--connect", nargs = "?", const = "", metavar = "ADDRESS",
+        help = "forward files to a running solve server")
+    mode.add_argument("--stream", action = "store_true",
+        help = "read files incrementally and print values as they are solved ('-' reads stdin)")
+    mode.add_argument("--check", action = "store_true",
+        help = "preprocess and validate files without solving them")
+    mode.add_argument("--preprocess", action = "store_true",
+        help = "print the preprocessed files without solving them")
+    parser.add_argument("--mmap", action = "store_true",
+        help = "memory-map files in streaming mode")
+    parser.add_argument("--format", choices = WRITERS, default = "repr",
+        help = "output format for solutions")
+    parser.add_argument("--include", action = "append", metavar = "PATTERN",
+        help = "only write variables matching this glob pattern (repeatable)")
+    parser.add_argument("--sort", choices = ["solved", "name"], default = "solved",
+        help = "order in which variables are written")
+    parser.add_argument("--trace", metavar = "FILE",
+        help = "record every solve step to FILE for replay with 'python -m engine.nexsys2trace replay'")
+    opts = parser.parse_args(argv[1:])
+
+    writer = WRITERS[opts.format](stdout.buffer, opts.include, opts.sort)
+
+    if opts.serve is not None:
+        serve(opts.serve)
+    elif opts.connect is not None:
+        client(opts.connect, *opts.files, writer = writer)
+    elif opts.stream:
+        stream(*opts.files, use_mmap = opts.mmap, writer = writer)
+    elif opts.check:
+        exit(0 if check(*opts.files) else 1)
+    elif opts.preprocess:
+        exit(0 if preprocess(*opts.files) else 1)
+    else:
+        main(*opts.files, writer = writer, trace_path = opts.trace)